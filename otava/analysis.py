@@ -15,22 +15,33 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional, Sequence, SupportsFloat, Tuple
+from functools import partial
+from typing import Dict, List, Optional, Sequence, SupportsFloat, Tuple, Type
 
 import numpy as np
 from scipy.stats import ttest_ind_from_stats
 
 from otava.change_point_divisive.base import (
     BaseStats,
+    Calculator,
     CandidateChangePoint,
     ChangePoint,
     GenericStats,
     SignificanceTester,
 )
-from otava.change_point_divisive.calculator import PairDistanceCalculator
+from otava.change_point_divisive.calculator import (
+    BlockedPairDistanceCalculator,
+    MultivariatePairDistanceCalculator,
+    PairDistanceCalculator,
+    SlidingWindowDistances,
+)
 from otava.change_point_divisive.detector import ChangePointDetector
 from otava.change_point_divisive.significance_test import (
+    FittedNullSignificanceTester,
     PermutationsSignificanceTester,
     PermutationStats,
 )
@@ -96,6 +107,12 @@ class TTestStats(BaseStats):
         }
 
 
+# Calculators that can be selected by name, e.g. in AnalysisOptions
+CALCULATORS: Dict[str, Type[Calculator]] = {
+    "pair_distance": PairDistanceCalculator,
+    "blocked": BlockedPairDistanceCalculator,
+}
+
 # Generic Change Point List
 GenCPList = List[ChangePoint[GenericStats]]
 # Permutation Change Point List
@@ -104,6 +121,47 @@ PermCPList = List[ChangePoint[PermutationStats]]
 TtestCPList = List[ChangePoint[TTestStats]]
 
 
+class IntervalMoments:
+    """
+    Index of cumulative sums of a series and of its squares, which gives the mean and the standard deviation
+    of any interval of the series with a couple of lookups instead of a pass over the interval.
+    """
+
+    def __init__(self, series: Sequence[SupportsFloat]):
+        self.series = np.asarray(series, dtype=np.float64)
+        # Centering reduces the loss of precision of the variances computed from the sums of squares
+        self.center = self.series.mean() if len(self.series) > 0 else 0.0
+        centered = self.series - self.center
+        self.sums = np.concatenate(([0.0], np.cumsum(centered)))
+        self.squares = np.concatenate(([0.0], np.cumsum(centered**2)))
+
+    def moments(self, starts: np.ndarray, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns means and standard deviations (zero for intervals of less than 2 points)
+        of non-empty intervals `series[starts[i] : stops[i]]`.
+        """
+        n = stops - starts
+        means = (self.sums[stops] - self.sums[starts]) / n
+        variances = np.maximum((self.squares[stops] - self.squares[starts]) / n - means**2, 0.0)
+        stds = np.where(n >= 2, np.sqrt(variances), 0.0)
+        means += self.center
+        # Variances within the rounding error of the sums, e.g. of constant intervals, are computed directly
+        tolerance = 64 * np.finfo(np.float64).eps * (self.squares[stops] + self.squares[starts]) / n
+        for i in np.flatnonzero((variances <= tolerance) & (n >= 2)):
+            interval = self.series[starts[i] : stops[i]]
+            means[i], stds[i] = np.mean(interval), np.std(interval)
+        return means, stds
+
+
+def _ttest(
+    mean_l: np.ndarray, std_l: np.ndarray, n_l: np.ndarray, mean_r: np.ndarray, std_r: np.ndarray, n_r: np.ndarray
+) -> np.ndarray:
+    """Vectorized p-values of `TTestSignificanceTester.compare` for the given statistics of both sides."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        (_, p) = ttest_ind_from_stats(mean_l, std_l, n_l, mean_r, std_r, n_r, alternative="two-sided")
+    return np.where(n_l + n_r > 2, p, 1.0)
+
+
 class TTestSignificanceTester(SignificanceTester):
     """
     Uses two-sided Student's T-test to decide if a candidate change point
@@ -169,12 +227,63 @@ class TTestSignificanceTester(SignificanceTester):
         stats = self.compare(left, right)
         return ChangePoint.from_candidate(candidate, stats)
 
+    def change_points(
+        self, candidates: List[CandidateChangePoint], moments: IntervalMoments, intervals: List[slice]
+    ) -> TtestCPList:
+        """
+        Same as `change_point` called for every candidate, but the statistics of all candidates are computed
+        at once: means and standard deviations come from `moments` of the series, and p-values from a single
+        vectorized t-test.
+        """
+        if not candidates:
+            return []
+        n = len(moments.series)
+        starts = np.array([0 if interval.start is None else interval.start for interval in intervals])
+        stops = np.array([n if interval.stop is None else interval.stop for interval in intervals])
+        indexes = np.array([candidate.index for candidate in candidates])
+        # The left subseries is in the first interval that reaches the candidate (the one it splits,
+        # or the one that ends at the candidate), and the right subseries in the last interval that
+        # starts before or at the candidate
+        left = np.searchsorted(stops, indexes, side="left")
+        right = np.searchsorted(starts, indexes, side="right") - 1
+        for i in range(len(candidates)):
+            if left[i] == len(intervals) or starts[left[i]] >= indexes[i] or right[i] < 0 or stops[right[i]] <= indexes[i]:
+                raise ValueError(
+                    f"Candidate Change Point at index={candidates[i].index} doesn't correspond to any interval in {intervals}."
+                )
+        left_starts, right_stops = starts[left], stops[right]
+        mean_l, std_l = moments.moments(left_starts, indexes)
+        mean_r, std_r = moments.moments(indexes, right_stops)
+        pvalues = _ttest(mean_l, std_l, indexes - left_starts, mean_r, std_r, right_stops - indexes)
+        return [
+            ChangePoint.from_candidate(
+                candidate,
+                TTestStats(mean_1=mean_l[i], mean_2=mean_r[i], std_1=std_l[i], std_2=std_r[i], pvalue=pvalues[i]),
+            )
+            for i, candidate in enumerate(candidates)
+        ]
+
 
 def fill_missing(data: Sequence[SupportsFloat]):
     """
     Forward-fills None occurrences with nearest previous non-None values.
     Initial None values are back-filled with the nearest future non-None value.
+
+    NumPy arrays mark missing values with NaN and are filled in place by vectorized operations;
+    each row of a 2d array is filled separately.
     """
+    if isinstance(data, np.ndarray):
+        missing = np.isnan(data)
+        if not missing.any():
+            return
+        # Index of the last present value at or before every position, -1 before the first one
+        positions = np.where(missing, -1, np.arange(data.shape[-1]))
+        np.maximum.accumulate(positions, axis=-1, out=positions)
+        first = np.expand_dims(np.argmax(~missing, axis=-1), -1)
+        positions = np.where(positions < 0, first, positions)
+        data[...] = np.take_along_axis(data, positions, axis=-1)
+        return
+
     prev = None
     for i in range(len(data)):
         if data[i] is None and prev is not None:
@@ -200,44 +309,126 @@ def merge(
         :param min_magnitude: minimum accepted relative change
     """
     tester = TTestSignificanceTester(max_pvalue)
-    while change_points:
+    moments = IntervalMoments(series)
+    count = len(change_points)
+    # Change points still in the list are linked to their neighbours by positions in the
+    # original list, -1 and count standing for the start and the end of the series
+    preceding = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    removed = [False] * count
+    bounds = [cp.index for cp in change_points]
+
+    # Heaps of (key, position, version) entries; entries whose version is behind the current
+    # version of their change point (i.e. whose stats were recomputed since) are skipped when popped.
+    # Ties are broken by position, as the first maximum/minimum in the list is selected.
+    versions = [0] * count
+    pvalues = []
+    magnitudes = []
+
+    def push(position: int):
+        stats = change_points[position].stats
+        # NaN p-value of equal constant sides means no difference, so such point is the weakest
+        pvalue_key = -np.inf if np.isnan(stats.pvalue) else -stats.pvalue
+        heapq.heappush(pvalues, (pvalue_key, position, versions[position]))
+        heapq.heappush(magnitudes, (stats.change_magnitude(), position, versions[position]))
+
+    def top(heap: list) -> int:
+        while versions[heap[0][1]] != heap[0][2] or removed[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    for position in range(count):
+        push(position)
+
+    remaining = count
+    while remaining:
 
         # Select the change point with weakest unacceptable P-value
         # If all points have acceptable P-values, select the change-point with
         # the least relative change:
-        weakest_cp = max(change_points, key=lambda c: c.stats.pvalue)
-        if weakest_cp.stats.pvalue < max_pvalue:
-            weakest_cp = min(change_points, key=lambda c: c.stats.change_magnitude())
-            if weakest_cp.stats.change_magnitude() > min_magnitude:
-                return change_points
+        weakest = top(pvalues)
+        if -pvalues[0][0] < max_pvalue:
+            weakest = top(magnitudes)
+            if change_points[weakest].stats.change_magnitude() > min_magnitude:
+                break
 
         # Remove the point from the list
-        weakest_cp_index = change_points.index(weakest_cp)
-        del change_points[weakest_cp_index]
+        removed[weakest] = True
+        remaining -= 1
+        if preceding[weakest] >= 0:
+            following[preceding[weakest]] = following[weakest]
+        if following[weakest] < count:
+            preceding[following[weakest]] = preceding[weakest]
 
         # We can't continue yet, because by removing a change_point
         # the adjacent change points changed their properties.
-        # Recompute the adjacent change point stats:
-        intervals = tester.get_intervals(change_points)
-
-        def recompute(index: int):
-            if index < 0 or index >= len(change_points):
-                return
-            cp = change_points[index]
-            change_points[index] = tester.change_point(cp.to_candidate(), series, intervals)
+        # Recompute the stats of the two change points following the removed one:
+        positions = []
+        position = following[weakest]
+        while position < count and len(positions) < 2:
+            positions.append(position)
+            position = following[position]
+        if not positions:
+            continue
+        left = preceding[positions[0]]
+        points = [bounds[left] if left >= 0 else 0]
+        points += [bounds[p] for p in positions]
+        points.append(bounds[position] if position < count else None)
+        intervals = [slice(start, stop) for start, stop in zip(points, points[1:])]
+        candidates = [change_points[p].to_candidate() for p in positions]
+        for p, cp in zip(positions, tester.change_points(candidates, moments, intervals)):
+            change_points[p] = cp
+            versions[p] += 1
+            push(p)
+
+    change_points[:] = [cp for cp, r in zip(change_points, removed) if not r]
+    return change_points
 
-        recompute(weakest_cp_index)
-        recompute(weakest_cp_index + 1)
 
+def _split_windows(
+    series: np.ndarray, offset: int, starts: List[int], window_len: int, max_pvalue: float,
+    calculator: Type[Calculator]
+) -> TtestCPList:
+    """
+    Finds change points in windows of `window_len` points beginning at each of `starts`, independently of
+    each other. `series` is the part of the whole series beginning at `offset` and covering all the windows;
+    returned change points are indexed in the whole series.
+    """
+    tester = TTestSignificanceTester(max_pvalue)
+    distances = None
+    if calculator is PairDistanceCalculator and len(series) > 0:
+        distances = SlidingWindowDistances(series, window_len)
+    change_points = []
+    for start in starts:
+        start -= offset
+        end = min(start + window_len, len(series))
+        window_calculator = calculator
+        if distances is not None:
+            window_calculator = partial(calculator, distances=distances.window(start, end))
+        algo = ChangePointDetector(significance_tester=tester, calculator=window_calculator)
+        for cp in algo.get_change_points(series, start, end):
+            cp.index += offset
+            change_points.append(cp)
     return change_points
 
 
 def split(series: Sequence[SupportsFloat], window_len: int = 30, max_pvalue: float = 0.001,
-          new_points: Optional[int] = None, old_cp: Optional[TtestCPList] = None) -> TtestCPList:
+          new_points: Optional[int] = None, old_cp: Optional[TtestCPList] = None,
+          calculator: Type[Calculator] = PairDistanceCalculator, fixed_stride: bool = False,
+          workers: Optional[int] = None) -> TtestCPList:
     """
     Split step of the change point detection process from "Hunter: Using Change Point Detection
     to Hunt for Performance Regressions" by Fleming et al. (https://doi.org/10.1145/3578244.3583719).
+
+    Parameters:
+        :param calculator: Calculator class used to find candidates within each window
+        :param fixed_stride: if True, windows begin every `window_len / 2` points instead of at the last change
+                             point found, so they don't depend on each other. Change points found by this mode
+                             are close to, but not always the same as, the ones found by the default mode
+        :param workers: number of worker processes evaluating the windows in the fixed stride mode;
+                        if `None`, the windows are evaluated in the calling process
     """
+    assert workers is None or workers > 0, f"workers={workers} must be positive"
     assert window_len >= 2, "Window length must be at least 2"
     start = 0
     step = int(window_len / 2)
@@ -258,42 +449,240 @@ def split(series: Sequence[SupportsFloat], window_len: int = 30, max_pvalue: flo
                 start = s
 
     tester = TTestSignificanceTester(max_pvalue)
-    while start < len(series):
-        # Sliding window series[start : end]
-        end = min(start + window_len, len(series))
-
-        algo = ChangePointDetector(significance_tester=tester, calculator=PairDistanceCalculator)
-        new_change_points = algo.get_change_points(series, start, end)
-        last_new_change_point_index = new_change_points[-1].index if new_change_points else 0
-        start = max(last_new_change_point_index, start + step)
-        # incremental Otava can duplicate an old cp
+    indexes = {cp.index for cp in change_points}
+    if fixed_stride:
+        data = np.asarray(series, dtype=np.float64)
+        starts = list(range(start, len(series), step))
+        if workers is None:
+            new_change_points = _split_windows(data[start:], start, starts, window_len, max_pvalue, calculator)
+        else:
+            # Each worker gets a contiguous run of windows, so the windows still share the distances.
+            # Workers are spawned rather than forked, as other threads might be running, e.g. fetching tests
+            chunks = [chunk for chunk in np.array_split(np.array(starts, dtype=int), workers) if len(chunk) > 0]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [
+                    pool.submit(
+                        _split_windows, data[chunk[0] : chunk[-1] + window_len], int(chunk[0]), chunk.tolist(),
+                        window_len, max_pvalue, calculator,
+                    )
+                    for chunk in chunks
+                ]
+                new_change_points = [cp for future in futures for cp in future.result()]
+        # Overlapping windows can find the same change point
         for cp in new_change_points:
-            if cp not in change_points:
-                change_points += [cp]
+            if cp.index not in indexes:
+                indexes.add(cp.index)
+                change_points.append(cp)
+    else:
+        # Consecutive windows overlap, so the distances are computed once for all windows
+        # and each window's calculator gets a view into them
+        distances = None
+        if calculator is PairDistanceCalculator and start < len(series):
+            distances = SlidingWindowDistances(np.asarray(series[start:], dtype=np.float64), window_len)
+        offset = start
+        while start < len(series):
+            # Sliding window series[start : end]
+            end = min(start + window_len, len(series))
+
+            window_calculator = calculator
+            if distances is not None:
+                window_calculator = partial(calculator, distances=distances.window(start - offset, end - offset))
+            algo = ChangePointDetector(significance_tester=tester, calculator=window_calculator)
+            new_change_points = algo.get_change_points(series, start, end)
+            last_new_change_point_index = new_change_points[-1].index if new_change_points else 0
+            start = max(last_new_change_point_index, start + step)
+            # incremental Otava can duplicate an old cp
+            for cp in new_change_points:
+                if cp.index not in indexes:
+                    indexes.add(cp.index)
+                    change_points.append(cp)
 
     # Sort change points by index; required by get_intervals() and maintained by merge()
     change_points.sort(key=lambda cp: cp.index)
     intervals = tester.get_intervals(change_points)
-    return [tester.change_point(cp.to_candidate(), series, intervals) for cp in change_points]
+    return tester.change_points([cp.to_candidate() for cp in change_points], IntervalMoments(series), intervals)
 
 
-def compute_change_points_orig(series: Sequence[SupportsFloat], max_pvalue: float = 0.001, seed: Optional[int] = None) -> Tuple[PermCPList, Optional[PermCPList]]:
+def _ttest_pvalues(windows: np.ndarray, taus: np.ndarray) -> np.ndarray:
+    """
+    Returns p-values of `TTestSignificanceTester.compare(windows[i, :taus[i]], windows[i, taus[i]:])` for all
+    rows `i` of 2d array `windows`, computed by vectorized calls.
+    """
+    n = windows.shape[1]
+    left = np.arange(n)[None, :] < taus[:, None]
+    n_l, n_r = taus, n - taus
+    mean_l = np.where(left, windows, 0).sum(axis=1) / n_l
+    mean_r = np.where(left, 0, windows).sum(axis=1) / n_r
+    deviations = (windows - np.where(left, mean_l[:, None], mean_r[:, None])) ** 2
+    std_l = np.where(n_l >= 2, np.sqrt(np.where(left, deviations, 0).sum(axis=1) / n_l), 0.0)
+    std_r = np.where(n_r >= 2, np.sqrt(np.where(left, 0, deviations).sum(axis=1) / n_r), 0.0)
+    return _ttest(mean_l, std_l, n_l, mean_r, std_r, n_r)
+
+
+def split_batch(data: np.ndarray, window_len: int = 30, max_pvalue: float = 0.001) -> List[TtestCPList]:
+    """
+    Split step (see `split`) for several series of the same length at once, e.g. all metrics of a test,
+    given as rows of 2d array `data`. Finds the same weak change points as `split` called for every row.
+
+    Every series advances its own sliding window like in `split`. The first iteration of the change point
+    detection in each window, i.e., the best candidate of the whole window and its t-test, is done for
+    the current windows of all series by the same vectorized calls. Most windows do not contain a change
+    point, so this is usually the only iteration. Only the windows with a significant candidate are passed to
+    `ChangePointDetector` to find all of their change points.
+    """
+    assert window_len >= 2, "Window length must be at least 2"
+    data = np.asarray(data, dtype=np.float64)
+    m, n = data.shape
+    step = int(window_len / 2)
+    tester = TTestSignificanceTester(max_pvalue)
+    starts = np.zeros(m, dtype=int)
+    change_points: List[TtestCPList] = [[] for _ in range(m)]
+    indexes = [set() for _ in range(m)]
+
+    while True:
+        active = np.flatnonzero(starts < n)
+        if len(active) == 0:
+            break
+        lengths = np.minimum(starts[active] + window_len, n) - starts[active]
+        for length in np.unique(lengths):
+            rows = active[lengths == length]
+            if length < 2:
+                # Windows with a single point don't have candidates
+                starts[rows] += step
+                continue
+            windows = data[rows[:, None], starts[rows, None] + np.arange(length)[None, :]]
+            candidates = PairDistanceCalculator.get_candidates_batch(windows)
+            pvalues = _ttest_pvalues(windows, np.array([candidate.index for candidate in candidates]))
+            for row, pvalue in zip(rows, pvalues):
+                start = int(starts[row])
+                new_change_points = []
+                if pvalue <= max_pvalue:
+                    algo = ChangePointDetector(significance_tester=tester, calculator=PairDistanceCalculator)
+                    new_change_points = algo.get_change_points(data[row, start : start + length])
+                    for cp in new_change_points:
+                        cp.index += start
+                last_new_change_point_index = new_change_points[-1].index if new_change_points else 0
+                starts[row] = max(last_new_change_point_index, start + step)
+                for cp in new_change_points:
+                    if cp.index not in indexes[row]:
+                        indexes[row].add(cp.index)
+                        change_points[row].append(cp)
+
+    result = []
+    for row in range(m):
+        change_points[row].sort(key=lambda cp: cp.index)
+        intervals = tester.get_intervals(change_points[row])
+        candidates = [cp.to_candidate() for cp in change_points[row]]
+        result.append(tester.change_points(candidates, IntervalMoments(data[row]), intervals))
+    return result
+
+
+def compute_change_points_batch(
+    data: np.ndarray, window_len: int = 50, max_pvalue: float = 0.001, min_magnitude: float = 0.0
+) -> List[Tuple[GenCPList, GenCPList]]:
+    """
+    Same as `compute_change_points` called for every row of 2d array `data`, but the split step
+    is done for all rows together by `split_batch`.
+    """
+    first_pass_pvalue = max_pvalue * 10 if max_pvalue < 0.05 else (max_pvalue * 2 if max_pvalue < 0.5 else max_pvalue)
+    data = np.asarray(data, dtype=np.float64)
+    all_weak_change_points = split_batch(data, window_len, first_pass_pvalue)
+    return [
+        (merge(weak_change_points, series, max_pvalue, min_magnitude), weak_change_points)
+        for series, weak_change_points in zip(data, all_weak_change_points)
+    ]
+
+
+def compute_change_points_orig(
+    series: Sequence[SupportsFloat], max_pvalue: float = 0.001, seed: Optional[int] = None,
+    calculator: Type[Calculator] = PairDistanceCalculator, workers: Optional[int] = None,
+    fitted_null: bool = False
+) -> Tuple[GenCPList, Optional[GenCPList]]:
     """
     The original algorithm presented in "A Nonparametric Approach for Multiple Change Point
     Analysis of Multivariate Data" by Matteson and James (https://doi.org/10.48550/arXiv.1306.4933).
 
     The algorithm recursively splits the series in a way to maximize some measure of dissimilarity (denoted qhat)
     between the chunks. Splitting happens as long as the dissimilarity is statistically significant.
+
+    The `calculator` is used both to find candidates and to compute qhat of permuted series. For long series
+    consider `BlockedPairDistanceCalculator`, which does not keep the quadratic matrix of distances in memory.
+
+    If `workers` is given, permutations of the significance test run in that many worker processes
+    (see `PermutationsSignificanceTester`). Permutation tests stop early once the candidate is certain
+    to be insignificant; only significant change points are returned, so this doesn't change the result.
+    Permuted qhats of the intervals that were not split are reused between the iterations.
+
+    If `fitted_null` is set, p-values are approximated by `FittedNullSignificanceTester` instead of running
+    permutations for every candidate. Its calibration takes a few hundred permutations per interval length,
+    more than the 100 permutations of the default test, but it resolves p-values far below their 1/101.
     """
-    tester = PermutationsSignificanceTester(max_pvalue=max_pvalue, permutations=100, calculator=PairDistanceCalculator, seed=seed)
-    detector = ChangePointDetector(significance_tester=tester, calculator=PairDistanceCalculator)
-    change_points = detector.get_change_points(series=series)
+    if fitted_null:
+        tester = FittedNullSignificanceTester(max_pvalue=max_pvalue, calculator=calculator, seed=seed)
+        detector = ChangePointDetector(significance_tester=tester, calculator=calculator)
+        return detector.get_change_points(series=series), None
+
+    tester = PermutationsSignificanceTester(
+        max_pvalue=max_pvalue, permutations=100, calculator=calculator, seed=seed, workers=workers,
+        early_stop=True, interval_cache=True
+    )
+    detector = ChangePointDetector(significance_tester=tester, calculator=calculator)
+    try:
+        change_points = detector.get_change_points(series=series)
+    finally:
+        tester.close()
     return change_points, None
 
 
+def compute_change_points_multivariate(
+    data: Sequence[Sequence[SupportsFloat]], max_pvalue: float = 0.001, seed: Optional[int] = None,
+    workers: Optional[int] = None, fitted_null: bool = False, min_magnitude: float = 0.0
+) -> Tuple[GenCPList, List[TtestCPList]]:
+    """
+    Multivariate version of `compute_change_points_orig` (the algorithm by Matteson and James is defined for
+    multivariate data). All series of `data`, e.g., all metrics of a test, are analyzed jointly by a single
+    detector pass with Euclidean distances between the vectors of their values at the same index,
+    so correlated series produce one joint change point instead of one per series.
+
+    Each series is standardized to zero mean and unit variance first, so that all of them contribute equally
+    to the distances regardless of their units and scales. Series without any values are left out.
+
+    Returns the joint change points and, for every series of `data`, the change points at the same
+    indexes with statistics of the t-test between the neighbouring segments of that series. A series only
+    gets the joint change points it changes at itself, i.e., with a P-value below `max_pvalue` and
+    a relative change above `min_magnitude`, the same criteria as `merge` applies.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    present = ~np.all(np.isnan(data), axis=1)
+    if not np.any(present):
+        return [], [[] for _ in data]
+    values = data[present].T
+    std = values.std(axis=0)
+    std[std == 0] = 1.0
+    values = (values - values.mean(axis=0)) / std
+    change_points, _ = compute_change_points_orig(
+        values, max_pvalue=max_pvalue, seed=seed, calculator=MultivariatePairDistanceCalculator, workers=workers,
+        fitted_null=fitted_null
+    )
+    tester = TTestSignificanceTester(max_pvalue)
+    intervals = tester.get_intervals(change_points)
+    candidates = [cp.to_candidate() for cp in change_points]
+    return change_points, [
+        [
+            cp
+            for cp in tester.change_points(candidates, IntervalMoments(series), intervals)
+            if cp.stats.pvalue < max_pvalue and cp.stats.change_magnitude() > min_magnitude
+        ]
+        if is_present
+        else []
+        for series, is_present in zip(data, present)
+    ]
+
+
 def compute_change_points(
     series: Sequence[SupportsFloat], window_len: int = 50, max_pvalue: float = 0.001, min_magnitude: float = 0.0,
-    new_data: Optional[int] = None, old_weak_cp: Optional[GenCPList] = None
+    new_data: Optional[int] = None, old_weak_cp: Optional[GenCPList] = None,
+    calculator: Type[Calculator] = PairDistanceCalculator, fixed_stride: bool = False, workers: Optional[int] = None
 ) -> Tuple[GenCPList, Optional[GenCPList]]:
     """
     Change Point detection algorithm described in "Hunter: Using Change Point Detection to Hunt for Performance
@@ -320,7 +709,13 @@ def compute_change_points(
         2. Merge step:
             - Filters out weak change points recursively going bottom-up, keeping only high-quality change points, i.e., the
               ones that meet either a p-value threshold criteria or relative magnitude change criteria.
+
+    With `fixed_stride`, the windows of the split step don't depend on each other and are evaluated
+    by `workers` processes in parallel (see `split`).
     """
     first_pass_pvalue = max_pvalue * 10 if max_pvalue < 0.05 else (max_pvalue * 2 if max_pvalue < 0.5 else max_pvalue)
-    weak_change_points = split(series, window_len, first_pass_pvalue, new_points=new_data, old_cp=old_weak_cp)
+    weak_change_points = split(
+        series, window_len, first_pass_pvalue, new_points=new_data, old_cp=old_weak_cp, calculator=calculator,
+        fixed_stride=fixed_stride, workers=workers
+    )
     return merge(weak_change_points, series, max_pvalue, min_magnitude), weak_change_points
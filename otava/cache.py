@@ -0,0 +1,159 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import json
+import logging
+import os
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from otava.series import AnalysisOptions, AnalyzedSeries, Series
+from otava.snapshot import SnapshotError, read_snapshot, save_snapshot
+
+# Bump when a change of the analysis changes the change points found for the same data and options
+CACHE_VERSION = 1
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+def _engine_version() -> str:
+    try:
+        package_version = version("apache-otava")
+    except PackageNotFoundError:
+        package_version = "unknown"
+    return f"{package_version}/{CACHE_VERSION}"
+
+
+class AnalysisCache:
+    """
+    Keeps the results of analyses on disk, so that analyzing the same data with the same options again,
+    e.g., by retries or by several jobs reporting on the same tests, returns the stored change points
+    instead of running the analysis.
+
+    Results are addressed by a hash of the times and values of the series, the analysis options and
+    the version of the analysis engine, and stored as snapshots, see `otava.snapshot`. The least recently
+    used results are evicted when the total size of the cache exceeds `max_size` bytes.
+
+    Many processes can share the cache directory: entries are written atomically and never modified,
+    and a missing or unreadable entry is just a cache miss.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    @staticmethod
+    def key(series: Series, options: AnalysisOptions) -> str:
+        digest = hashlib.sha256()
+        digest.update(
+            json.dumps(
+                {
+                    "engine": _engine_version(),
+                    "options": options.to_json(execution=False),
+                    "metrics": list(series.data.keys()),
+                    "length": len(series.time),
+                    "time_dtype": series.time.dtype.kind,
+                },
+                sort_keys=True,
+            ).encode("utf-8")
+        )
+        time_dtype = "<f8" if series.time.dtype.kind == "f" else "<i8"
+        digest.update(np.ascontiguousarray(series.time, dtype=time_dtype).data)
+        values = np.ascontiguousarray(series.values, dtype="<f8")
+        # NaNs with different payloads mark the same missing values
+        digest.update(np.where(np.isnan(values), np.nan, values).data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def supports(options: AnalysisOptions) -> bool:
+        """Snapshots only hold change points with t-test statistics, which `orig_edivisive` doesn't give."""
+        return not options.orig_edivisive
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.snapshot"
+
+    def analyze(self, series: Series, options: AnalysisOptions) -> AnalyzedSeries:
+        """Returns the stored analysis of the series, or analyzes it and stores the result."""
+        if not self.supports(options):
+            return series.analyze(options)
+        key = self.key(series, options)
+        analyzed_series = self.load(key, series, options)
+        if analyzed_series is not None:
+            logging.info(f"Using cached change points for test {series.test_name}")
+            return analyzed_series
+        analyzed_series = series.analyze(options)
+        self.save(key, analyzed_series)
+        return analyzed_series
+
+    def load(self, key: str, series: Series, options: AnalysisOptions) -> Optional[AnalyzedSeries]:
+        path = self.path(key)
+        try:
+            stored = read_snapshot(path)
+            # Mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as err:
+            logging.warning(f"Ignoring unreadable cache entry {path}: {err}")
+            return None
+        except SnapshotError as err:
+            logging.warning(f"Ignoring unreadable cache entry {path}: {err.message}")
+            return None
+        # The data are the same, but the metric properties and attributes come from the given series
+        analyzed_series = AnalyzedSeries(
+            series, options, dict(stored.change_points), dict(stored.weak_change_points)
+        )
+        analyzed_series.change_points_timestamp = stored.change_points_timestamp
+        return analyzed_series
+
+    def save(self, key: str, analyzed_series: AnalyzedSeries):
+        path = self.path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Other processes see either no entry or a complete one
+            save_snapshot(analyzed_series, path)
+        except OSError as err:
+            logging.warning(f"Failed to store cache entry {path}: {err}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in `max_size` bytes."""
+        entries = []
+        for path in self.directory.glob("*.snapshot"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as err:
+                logging.warning(f"Failed to evict cache entry {path}: {err}")
+                continue
+            total_size -= size
@@ -16,7 +16,7 @@
 # under the License.
 
 from dataclasses import dataclass, fields
-from typing import Generic, List, Optional, TypeVar
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
 
 from numpy.typing import NDArray
 
@@ -95,19 +95,50 @@ class Calculator:
     '''Abstract class for calculator. Calculator provides an interface to get best change point candidate'''
     def __init__(self, series: NDArray):
         self.series = series
+        # Best candidates of intervals, keyed by (start, stop) of the interval
+        self._candidates: Dict[Tuple[int, int], CandidateChangePoint] = {}
 
     def get_next_candidate(self, intervals: List[slice]) -> Optional[CandidateChangePoint]:
-        '''Returns list of existing change points to find next best change point candidate.'''
-        candidates = [
-            self.get_candidate_change_point(interval=interval)
-            for interval in intervals
-            if len(self.series[interval]) > 1
-        ]
+        '''Returns list of existing change points to find next best change point candidate.
+
+        The best candidate of an interval depends only on the values within the interval, so candidates
+        are memoized by interval. Between the iterations of the divisive algorithm only the interval that
+        was split by the last change point is replaced by two new intervals, hence only their candidates
+        are computed. Candidates of intervals that are gone are dropped from the cache.'''
+        candidates = {}
+        for interval in intervals:
+            key = interval.indices(len(self.series))[:2]
+            if key[1] - key[0] <= 1:
+                continue
+            candidate = self._candidates.get(key)
+            if candidate is None:
+                candidate = self.get_candidate_change_point(interval=interval)
+            candidates[key] = candidate
+        self._candidates = candidates
         if not candidates:
             return
-        candidate = max(candidates, key=lambda point: point.qhat)
+        candidate = max(candidates.values(), key=lambda point: point.qhat)
         return candidate
 
+    def _with_series(self, series: NDArray) -> 'Calculator':
+        '''Returns a new calculator of `series` with the same configuration as this one.
+        Subclasses with constructor parameters besides the series must override it.'''
+        return type(self)(series)
+
+    def permutations_batch_size(self) -> int:
+        '''Number of permutations that `get_permuted_qhats` should be given at once.'''
+        return 1
+
+    def get_permuted_qhats(self, permutations: NDArray, intervals: List[slice]) -> List[float]:
+        '''Returns qhats of the best candidates of the series reordered by every row of 2d array `permutations`
+        (which only reorder indexes within `intervals`), i.e., `get_next_candidate(intervals).qhat` of
+        a calculator of `series[permutation]` for every permutation. Used by permutation significance test.
+        Subclasses may override it to evaluate permutations using values precomputed for the series.'''
+        return [
+            self._with_series(self.series[permutation]).get_next_candidate(intervals).qhat
+            for permutation in permutations
+        ]
+
     def get_candidate_change_point(self, interval: slice) -> CandidateChangePoint:
         '''Given start and end indexes return best candidate for a change point.
         Note that start and end are indexes of the first and last element, i.e. a slice [start:end+1].'''
@@ -16,19 +16,168 @@
 # under the License.
 
 
+from typing import List, Optional, Tuple
+
 import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
 from numpy.typing import NDArray
 
 from otava.change_point_divisive.base import Calculator, CandidateChangePoint
 
 
+def _update_argmax(best: Tuple[Optional[int], float], block: NDArray) -> Tuple[Optional[int], float]:
+    '''Updates the running maximum `best = (row, value)` of a matrix that is evaluated in blocks of columns,
+    from left to right, with the next `block`. Start with `best = (None, -np.inf)`.
+
+    Ties are resolved in favor of the smallest row and then the smallest column, so the result is the same
+    as `np.argmax` of the whole matrix would give. The first block always sets the result, so an all-NaN
+    matrix gives its first element, as `np.argmax`.'''
+    i, j = np.unravel_index(np.argmax(block), block.shape)
+    best_row, best_value = best
+    if best_row is None or block[i, j] > best_value or (block[i, j] == best_value and i < best_row):
+        return i, block[i, j]
+    return best
+
+
+class SlidingWindowDistances:
+    '''Pairwise distances `|series[i] - series[j]| ** power` for all pairs with `|i - j| < window_len`.
+
+    The distances are kept in a band matrix of shape (N, 2 * window_len - 1), such that
+
+                        band[i, window_len - 1 + d] = |series[i] - series[i + d]| ** power,
+
+    for `|d| < window_len` and `0 <= i + d < N` (other elements of the band are unspecified),
+
+    which takes O(N * window_len) memory instead of O(N^2). The layout is chosen so that the full matrix of
+    distances of any window `series[start:end]` with `end - start <= window_len` is a strided view into
+    the band, i.e., windows share the distances and no copies are made.'''
+
+    def __init__(self, series: NDArray, window_len: int, power: float = 1.):
+        assert window_len >= 1, f"window_len={window_len} must be positive"
+        self.window_len = window_len
+        series = np.asarray(series, dtype=np.float64)
+        # Elements of the band outside of the series are never read by `window`
+        padded = np.pad(series, window_len - 1)
+        self.band = sliding_window_view(padded, 2 * window_len - 1) - series[:, None]
+        np.abs(self.band, out=self.band)
+        if power != 1:
+            np.power(self.band, power, out=self.band)
+
+    def window(self, start: int, end: int) -> NDArray:
+        '''Returns read-only matrix of pairwise distances of `series[start:end]`.'''
+        n = end - start
+        assert 0 <= start and end <= len(self.band), f"window [{start}:{end}] is out of bounds"
+        assert n <= self.window_len, f"window [{start}:{end}] is longer than window_len={self.window_len}"
+        row_stride, column_stride = self.band.strides
+        return as_strided(
+            self.band[start, self.window_len - 1 :],
+            shape=(n, n),
+            strides=(row_stride - column_stride, column_stride),
+            writeable=False,
+        )
+
+
 class PairDistanceCalculator(Calculator):
-    def __init__(self, series: NDArray, power: float = 1.):
+    # Maximal number of elements of each (n × block) array used by `_get_best_Q`
+    _Q_BLOCK_ELEMENTS = 2**17
+    # Memory for the batches of `get_permuted_qhats`, which keep about `_PERMUTATIONS_ARRAYS` arrays
+    # of (permutations × N × N) floats at once. Batches that do not fit into CPU cache are slower
+    # than evaluating permutations one by one, so only short series are batched.
+    _PERMUTATIONS_MEMORY = 2 * 2**20
+    _PERMUTATIONS_ARRAYS = 8
+
+    def __init__(self, series: NDArray, power: float = 1., distances: Optional[NDArray] = None):
+        '''distances - optional precomputed matrix of pairwise distances of the series
+        (e.g. a view from `SlidingWindowDistances`)'''
         super().__init__(series)
         assert 0 < power < 2, f"power={power} isn't in (0, 2)"
+        assert distances is None or distances.shape == (len(series), len(series)), "distances must be (N, N) matrix"
         self.power = power
+        self.distances = distances
+        self.column_sums = None
         self.V = None
         self.H = None
+        # Buffers reused by `_get_best_Q` across intervals
+        self._Q_workspace = np.empty(0)
+        self._mask_workspace = np.empty(0, dtype=bool)
+
+    def _with_series(self, series: NDArray) -> 'PairDistanceCalculator':
+        return type(self)(series, power=self.power)
+
+    def append(self, values: NDArray):
+        '''Appends `values` to the end of the series, extending precomputed `distances`, `column_sums`,
+        `V` and `H` in place instead of recomputing them for the whole series.
+
+        Let `N = len(series)` before the call and `k = len(values)`. Only the new `k` columns of `distances`
+        (and the symmetric rows) are computed, which is O(N·k). The existing values of `V` and `H` do not
+        change, since both functions only look at elements to the left (`V`) or to the right (`H`) within
+        `series[0:κ]`. So new values are
+
+                        V(0, τ) = Σ distances[0:τ, τ],                     for N <= τ < N + k,
+                        H(τ, κ) = H(τ, N) + Σ distances[τ, max(τ + 1, N):κ],   for N < κ <= N + k.
+
+        The arrays are backed by buffers that grow geometrically, so appending one point at a time
+        costs amortized O(N) per point rather than a full copy of the O(N^2) arrays.'''
+        values = np.asarray(values, dtype=self.series.dtype)
+        if len(values) == 0:
+            return
+        n = len(self.series)
+        if (self.V is None or self.H is None) and self.distances is not None:
+            # Precomputed distances were given for the current series only
+            self._calculate_pairwise_differences()
+        self._series_buffer = self._reserve(getattr(self, "_series_buffer", self.series), n + len(values), axes=1)
+        self._series_buffer[n : n + len(values)] = values
+        self.series = self._series_buffer[: n + len(values)]
+        if self.V is None or self.H is None:
+            # Nothing was precomputed yet, it will be done on the first request
+            return
+        self._extend_pairwise_differences(n)
+
+    @staticmethod
+    def _reserve(buffer: NDArray, size: int, axes: Optional[int] = None) -> NDArray:
+        '''Returns `buffer` if its first `axes` dimensions (all by default) can hold `size` elements,
+        or a bigger copy of it otherwise.'''
+        axes = buffer.ndim if axes is None else axes
+        capacity = buffer.shape[0]
+        if size <= capacity:
+            return buffer
+        capacity = max(size, int(capacity * 1.5))
+        new_buffer = np.zeros((capacity,) * axes + buffer.shape[axes:], dtype=buffer.dtype)
+        new_buffer[tuple(slice(0, dim) for dim in buffer.shape)] = buffer
+        return new_buffer
+
+    def _pairwise_distances(self, x: NDArray, y: NDArray) -> NDArray:
+        '''Returns matrix of distances `|x[i] - y[j]| ** power` between elements of `x` and `y`.'''
+        return np.power(np.abs(x[:, None] - y[None, :]), self.power)
+
+    def _extend_pairwise_differences(self, n: int):
+        '''Extends `distances`, `V` and `H` from the first `n` elements of the series to the whole series.'''
+        total = len(self.series)
+        new_columns = self._pairwise_distances(self.series, self.series[n:])
+
+        self._distances = self._reserve(self._distances, total)
+        self._distances[:total, n:total] = new_columns
+        self._distances[n:total, :total] = new_columns.T
+        self.distances = self._distances[:total, :total]
+
+        # Only entries above the main diagonal, i.e., `distances[i, j]` with `i < j`
+        upper = np.triu(new_columns[:-1], k=1 - n)
+
+        self._V = self._reserve(self._V, total - 1)
+        self._V[n - 1 : total - 1] = upper.sum(axis=0)
+        self.V = self._V[: total - 1]
+
+        self._H = self._reserve(self._H, total - 1)
+        base = np.zeros(total - 1)
+        if n > 1:
+            base[: n - 1] = self._H[: n - 1, n - 2]
+        self._H[: total - 1, n - 1 : total - 1] = base[:, None] + upper.cumsum(axis=1)
+        self.H = self._H[: total - 1, : total - 1]
+
+        self._column_sums = self._reserve(self._column_sums, total)
+        self._column_sums[:total, n:total] = new_columns.cumsum(axis=0)
+        self._column_sums[n:total, :n] = self._column_sums[n - 1, :n] + new_columns[:n].T.cumsum(axis=0)
+        self.column_sums = self._column_sums[:total, :total]
 
     def _calculate_pairwise_differences(self):
         '''Precomputes `H` and `V` functions that are used for computation of `Q` function.
@@ -65,6 +214,11 @@ class PairDistanceCalculator(Calculator):
         Note: The reason not all values of `V(start, τ, κ)` are precomputed is that
               we do not need them all. The values of `start` will depend on critical
               points we find. Precomuting them for all possible values is a waste.
+              Instead, matrix `column_sums` of cumulative sums of the columns of
+              `distances` is precomputed,
+                            column_sums[i, τ] = Σ distances[0 : i + 1, τ],
+              so that the sum above is a lookup `column_sums[start - 1, τ]`
+              rather than a reduction over `start` rows for every interval.
 
 
         Matrix H contains the following values of function `H(start, τ, κ)`:
@@ -79,10 +233,13 @@ class PairDistanceCalculator(Calculator):
             matrix H contains all possible values of function `H`.
         Note: We precomputed all values of `H(start, τ, κ)` because all of them are needed
               for the very first iteration (`start=0` and `end=N`).'''
-        self.distances = np.power(np.abs(self.series[:, None] - self.series[None, :]), self.power)
+        if self.distances is None:
+            self.distances = self._pairwise_distances(self.series, self.series)
         triu = np.triu(self.distances, k=1)[:-1, 1:]
         self.V = triu.sum(axis=0)
         self.H = triu.cumsum(axis=1)
+        self.column_sums = self.distances.cumsum(axis=0)
+        self._distances, self._V, self._H, self._column_sums = self.distances, self.V, self.H, self.column_sums
 
     def _get_Q_vals(self, start: int, end: int) -> NDArray:
         '''Computes matrices A, B, C where all possible values of function `Q` are
@@ -118,37 +275,171 @@ class PairDistanceCalculator(Calculator):
         if self.V is None or self.H is None:
             self._calculate_pairwise_differences()
 
-        V = self.V[start : end - 1] - self.distances[0 : start, start + 1 : end].sum(axis=0)
+        V = self.V[start : end - 1]
+        if start > 0:
+            V = V - self.column_sums[start - 1, start + 1 : end]
         H = self.H[start : end - 1, start : end - 1]
+        return self._Q_vals(V, H)
+
+    @staticmethod
+    def _Q_vals(V: NDArray, H: NDArray) -> NDArray:
+        '''Computes matrix Q = A - B - C (see `_get_Q_vals`) from the values of functions `V` and `H`
+        for an interval, i.e., from `V(start, τ)` for `start < τ < end` and `H(τ, κ)` for `start <= τ < κ - 1 < end`.
 
-        taus = np.arange(start + 1, end)[:, None]
-        kappas = np.arange(start + 2, end + 1)[None, :]
+        Leading dimensions of `V` and `H` are treated as a batch of independent intervals of the same length.'''
+        n = V.shape[-1]
+        taus = np.arange(1, n + 1)[:, None]
+        kappas = np.arange(2, n + 2)[None, :]
 
-        A = np.zeros((end - 1 - start, end - 1 - start))
-        A_coefs = 2 / (kappas - start)
-        A[1:, :] = np.cumsum(V)[:-1, None]
-        A = A_coefs * np.triu(np.cumsum(H, axis=0) - A, k=0)
+        A = np.zeros(V.shape + (n,))
+        A_coefs = 2 / kappas
+        A[..., 1:, :] = np.cumsum(V, axis=-1)[..., :-1, None]
+        A = A_coefs * np.triu(np.cumsum(H, axis=-2) - A, k=0)
 
-        B = np.zeros((end - 1 - start, end - 1 - start))
+        B = np.zeros(V.shape + (n,))
         B_num = 2 * (kappas - taus)
-        B_den = (kappas - start) * (taus - start - 1)
+        B_den = kappas * (taus - 1)
         B_mask = np.triu(np.ones_like(B_den, dtype=bool), k=0)
         B_out = np.zeros_like(B_den, dtype=float)
         B_coefs = np.divide(B_num, B_den, out=B_out, where=B_mask & (B_den != 0))
-        B[1:, 1:] = B_coefs[1:, 1:] * np.cumsum(V)[:-1, None]
+        B[..., 1:, 1:] = B_coefs[1:, 1:] * np.cumsum(V, axis=-1)[..., :-1, None]
 
-        C = np.zeros((end - 1 - start, end - 1 - start))
-        C_num = 2 * (taus - start)
-        C_den = (kappas - start) * (kappas - taus - 1)
+        C = np.zeros(V.shape + (n,))
+        C_num = 2 * taus
+        C_den = kappas * (kappas - taus - 1)
         C_mask = np.triu(np.ones_like(C_den, dtype=bool), k=1)
         C_out = np.zeros_like(C_den, dtype=float)
         C_coefs = np.divide(C_num, C_den, out=C_out, where=C_mask & (C_den != 0))
-        C[:-1, 1:] = C_coefs[:-1, 1:] * np.flipud(np.cumsum(np.flipud(H[1:, 1:]), axis=0))
+        C[..., :-1, 1:] = C_coefs[:-1, 1:] * np.flip(np.cumsum(np.flip(H[..., 1:, 1:], axis=-2), axis=-2), axis=-2)
 
         # Element of matrix `Q_{i, j}` is equal to `Q(τ, κ) = Q(i + 1, j + 2) = QQ(sequence[start : i + 1], sequence[i + 1 : j + 2])`.
         # So, critical point is `τ = i + 1`.
         return A - B - C
 
+    def permutations_batch_size(self) -> int:
+        return max(1, self._PERMUTATIONS_MEMORY // (self._PERMUTATIONS_ARRAYS * len(self.series) ** 2 * 8))
+
+    def get_permuted_qhats(self, permutations: NDArray, intervals: List[slice]) -> NDArray:
+        '''Evaluates a batch of permutations using the distances of the series, which are computed only once.
+
+        Reordering the series only reorders rows and columns of `distances`, so distances of the series
+        reordered by `permutation` are gathered as `distances[permutation[i], permutation[j]]`. Moreover,
+        for an interval `[start:end]` only a strip of them with `i < end` and `start <= j < end` is needed:
+        columns of the strip give `V`, its part with `i < start` gives the `column_sums` adjustment, and
+        the rows within the interval give `H`. The sums are done in the same order as in
+        `_calculate_pairwise_differences` and `_get_Q_vals`, so qhats are bitwise identical to those of
+        calculators of the reordered series.'''
+        if self.V is None or self.H is None:
+            self._calculate_pairwise_differences()
+
+        qhats = np.full(len(permutations), -np.inf)
+        for interval in intervals:
+            start, end = interval.indices(len(self.series))[:2]
+            if end - start <= 1:
+                continue
+            strip = self.distances[permutations[:, :end, None], permutations[:, None, start:end]]
+            # Only entries above the main diagonal of `distances`, i.e., `strip[:, i, c]` with `i < start + c`
+            upper = np.triu(strip, k=1 - start)
+            V = upper[:, :, 1:].sum(axis=-2)
+            if start > 0:
+                V -= strip[:, :start, 1:].sum(axis=-2)
+            H = upper[:, start : end - 1, 1:].cumsum(axis=-1)
+            for i in range(len(permutations)):
+                qhats[i] = max(qhats[i], self._best_Q(V[i], H[i])[1])
+        return qhats
+
+    @classmethod
+    def get_candidates_batch(cls, windows: NDArray, power: float = 1.) -> List[CandidateChangePoint]:
+        '''Finds the best candidate of every row of 2d array `windows`, i.e., the same candidates as
+        `get_candidate_change_point(slice(None, None))` of a calculator of each row, but with all rows
+        processed by the same vectorized calls.'''
+        assert 0 < power < 2, f"power={power} isn't in (0, 2)"
+        batch, n = windows.shape
+        assert n > 1, f"windows must have at least 2 columns, but {n} were given."
+        distances = np.power(np.abs(windows[:, :, None] - windows[:, None, :]), power)
+        triu = np.triu(distances, k=1)[:, :-1, 1:]
+        Q = cls._Q_vals(triu.sum(axis=-2), triu.cumsum(axis=-1)).reshape(batch, -1)
+        best = np.argmax(Q, axis=1)
+        return [
+            CandidateChangePoint(index=best[b] // (n - 1) + 1, qhat=Q[b, best[b]])
+            for b in range(batch)
+        ]
+
+    def _get_workspace(self, n: int, block: int) -> Tuple[NDArray, NDArray, NDArray, NDArray, NDArray]:
+        '''Returns three float and two boolean (n × block) arrays backed by buffers that are reused across calls.'''
+        size = n * block
+        if len(self._Q_workspace) < 3 * size:
+            self._Q_workspace = np.empty(3 * size)
+            self._mask_workspace = np.empty(2 * size, dtype=bool)
+        floats = self._Q_workspace[: 3 * size].reshape(3, n, block)
+        masks = self._mask_workspace[: 2 * size].reshape(2, n, block)
+        return floats[0], floats[1], floats[2], masks[0], masks[1]
+
+    def _get_best_Q(self, start: int, end: int) -> Tuple[int, float]:
+        '''Returns `(i, Q[i, j])` for the maximal element of matrix `Q = self._get_Q_vals(start, end)`,
+        the same one as `np.argmax` would find, without materializing the matrix.'''
+        if self.V is None or self.H is None:
+            self._calculate_pairwise_differences()
+
+        V = self.V[start : end - 1]
+        if start > 0:
+            V = V - self.column_sums[start - 1, start + 1 : end]
+        H = self.H[start : end - 1, start : end - 1]
+        return self._best_Q(V, H)
+
+    def _best_Q(self, V: NDArray, H: NDArray) -> Tuple[int, float]:
+        '''Returns `(i, Q[i, j])` for the maximal element of matrix `Q = self._Q_vals(V, H)`.
+
+        Matrix `Q` is evaluated in blocks of columns (i.e., of `κ` values) in a few workspace arrays
+        using in-place operations, keeping only the running maximum. The operations are the same as
+        in `_Q_vals`, so the values of `Q` are bitwise identical. Elements below the diagonal are
+        skipped, since they never win: they are zeros in `_Q_vals`, and `Q[0, 0] >= 0` comes first.'''
+        n = len(V)
+        block = max(1, min(n, self._Q_BLOCK_ELEMENTS // n))
+        workspace = self._get_workspace(n, block)
+
+        # `V_sums[i] = Σt<i V(start, start + 1 + t)`, the values subtracted in `A` and multiplied in `B`
+        V_sums = np.zeros(n)
+        np.cumsum(V[:-1], out=V_sums[1:])
+        rows = np.arange(n)[:, None]
+        taus = np.arange(1, n + 1, dtype=np.float64)[:, None]
+
+        best = (None, -np.inf)
+        for j0 in range(0, n, block):
+            j1 = min(j0 + block, n)
+            Q, coefs, sums, lower, strictly_upper = (array[:, : j1 - j0] for array in workspace)
+            columns = np.arange(j0, j1)[None, :]
+            kappas = np.arange(j0 + 2, j1 + 2, dtype=np.float64)[None, :]
+            np.greater(rows, columns, out=lower)
+            np.less(rows, columns, out=strictly_upper)
+
+            # A = 2 / κ * (Σ H - Σ V)
+            np.cumsum(H[:, j0:j1], axis=0, out=Q)
+            np.subtract(Q, V_sums[:, None], out=Q)
+            np.multiply(2 / kappas, Q, out=Q)
+
+            # B = 2 * (κ - τ) / κ / (τ - 1) * Σ V, zero for τ = 1
+            np.subtract(kappas, taus[1:], out=coefs[1:])
+            np.multiply(2, coefs[1:], out=coefs[1:])
+            np.subtract(taus[1:], 1, out=sums[1:])
+            np.multiply(kappas, sums[1:], out=sums[1:])
+            np.divide(coefs[1:], sums[1:], out=coefs[1:])
+            np.multiply(coefs[1:], V_sums[1:, None], out=coefs[1:])
+            np.subtract(Q[1:], coefs[1:], out=Q[1:])
+
+            # C = 2 * τ / κ / (κ - τ - 1) * Σ H over the rows below, zero for κ = τ + 1
+            np.cumsum(H[:0:-1, j0:j1], axis=0, out=sums[-2::-1])
+            np.subtract(kappas, taus, out=coefs)
+            np.subtract(coefs, 1, out=coefs)
+            np.multiply(kappas, coefs, out=coefs)
+            np.divide(2 * taus, coefs, out=coefs, where=strictly_upper)
+            np.multiply(coefs, sums, out=coefs, where=strictly_upper)
+            np.subtract(Q, coefs, out=Q, where=strictly_upper)
+
+            np.copyto(Q, -np.inf, where=lower)
+            best = _update_argmax(best, Q)
+        return best
+
     def get_candidate_change_point(self, interval: slice) -> CandidateChangePoint:
         '''For a given `slice(start, end)` finds potential critical point in subsequence series[slice],
         i.e., from index `start` to `end - 1` inclusive.
@@ -185,6 +476,120 @@ class PairDistanceCalculator(Calculator):
         end = len(self.series) if interval.stop is None else interval.stop
         assert end - start > 1, f"interval must be a non-empty slice, but array[{start}:{end}] was given."
 
-        Q = self._get_Q_vals(start, end)
-        i, j = np.unravel_index(np.argmax(Q), Q.shape)
-        return CandidateChangePoint(index=i + 1 + start, qhat=Q[i][j])
+        i, qhat = self._get_best_Q(start, end)
+        return CandidateChangePoint(index=i + 1 + start, qhat=qhat)
+
+
+class MultivariatePairDistanceCalculator(PairDistanceCalculator):
+    '''`PairDistanceCalculator` for multivariate series, given as 2d array of shape (N, M), i.e.,
+    one row of M values per point. The distance between two points is the Euclidean distance
+
+                        D(i, j) = ||series[i] - series[j]|| ** power,
+
+    which is what the E-divisive algorithm is defined with. Everything else is the same as for univariate
+    series, so a change of the joint distribution of all M values is found by a single detector pass.
+
+    All columns contribute to the distances equally, so they should be on comparable scales
+    (see `otava.analysis.compute_change_points_multivariate`).'''
+
+    def __init__(self, series: NDArray, power: float = 1., distances: Optional[NDArray] = None):
+        assert np.ndim(series) == 2, f"series must be (N, M) matrix, but {np.ndim(series)}d array was given."
+        super().__init__(series, power=power, distances=distances)
+
+    def _pairwise_distances(self, x: NDArray, y: NDArray) -> NDArray:
+        # Summing over the columns one by one keeps the memory at O(len(x) * len(y)) instead of O(len(x) * len(y) * M)
+        squares = np.zeros((len(x), len(y)))
+        for column in range(x.shape[1]):
+            squares += np.square(x[:, column, None] - y[None, :, column])
+        return np.power(squares, self.power / 2)
+
+
+class BlockedPairDistanceCalculator(Calculator):
+    '''Computes the same candidates as `PairDistanceCalculator`, but never materializes the matrix of
+    pairwise distances. Instead, distances are computed on the fly in blocks of columns, so that the
+    memory used by each block stays within `memory_budget` bytes. Optionally, blocks can be computed
+    in `float32` to halve the memory footprint (at the cost of precision of `qhat`).
+
+    The time complexity for an interval of length `n` is still O(n^2), but the memory complexity is
+    O(n * block), where `block` is the number of columns that fit into the budget.'''
+
+    # Number of (n × block) arrays that are alive at the same time in `get_candidate_change_point`
+    _BLOCK_ARRAYS = 5
+
+    def __init__(self, series: NDArray, power: float = 1., memory_budget: int = 64 * 2**20, dtype=np.float64):
+        super().__init__(series)
+        assert 0 < power < 2, f"power={power} isn't in (0, 2)"
+        assert memory_budget > 0, f"memory_budget={memory_budget} must be positive"
+        self.power = power
+        self.memory_budget = memory_budget
+        self.dtype = np.dtype(dtype)
+
+    def _with_series(self, series: NDArray) -> 'BlockedPairDistanceCalculator':
+        return type(self)(series, power=self.power, memory_budget=self.memory_budget, dtype=self.dtype)
+
+    def _block_size(self, n: int) -> int:
+        return max(1, self.memory_budget // (self._BLOCK_ARRAYS * n * self.dtype.itemsize))
+
+    def get_candidate_change_point(self, interval: slice) -> CandidateChangePoint:
+        '''For a given `slice(start, end)` finds potential critical point in subsequence series[slice].
+        See `PairDistanceCalculator.get_candidate_change_point` for the definition of function `Q`.
+
+        Within the interval (with indexes shifted so that `start = 0`), function `Q` can be written as
+
+            Q(τ, κ) = 2 / κ * (ΣH(τ, κ) - ΣV(τ))
+                      - 2 * (κ - τ) / κ / (τ - 1) * ΣV(τ)
+                      - 2 * τ / κ / (κ - τ - 1) * (ΣV(κ) - ΣH(τ, κ)),
+
+        where `ΣV(τ) = Σ distances[i, j] for 0 <= i < j < τ` and `ΣH(τ, κ) = Σt=0,τ-1 H(t, κ)` with
+        `H(t, κ) = Σ distances[t, t+1:κ]`. The method sweeps `κ` from left to right. Since
+        `H(t, κ + 1) = H(t, κ) + distances[t, κ]`, a block of columns of `distances` is all that is
+        needed to get all values of `Q(τ, κ)` for a block of `κ` values. Only the running maximum is kept.'''
+        start = 0 if interval.start is None else interval.start
+        end = len(self.series) if interval.stop is None else interval.stop
+        assert end - start > 1, f"interval must be a non-empty slice, but array[{start}:{end}] was given."
+
+        x = np.asarray(self.series[start:end], dtype=self.dtype)
+        n = len(x)
+        block = self._block_size(n)
+
+        # `sum_V[τ] = ΣV(τ)` for τ = 0, ..., n; filled in as the sweep goes on
+        sum_V = np.zeros(n + 1, dtype=self.dtype)
+        # `H(t, k0)` for t = 0, ..., n - 1, where `k0` is the first `κ` of the current block
+        H_carry = np.zeros(n, dtype=self.dtype)
+        rows = np.arange(n)[:, None]
+
+        best = (None, -np.inf)
+        k0 = 1
+        while k0 < n:
+            k1 = min(k0 + block, n)
+            # Columns `j = k0, ..., k1 - 1` of the upper triangle of `distances`,
+            # only rows `t < k1` may be non-zero
+            cols = np.arange(k0, k1)[None, :]
+            D = np.power(np.abs(x[:k1, None] - x[None, k0:k1]), self.power, dtype=self.dtype)
+            D[rows[:k1] >= cols] = 0
+            sum_V[k0 + 1 : k1 + 1] = sum_V[k0] + np.cumsum(D.sum(axis=0))
+
+            # `H[t, κ - k0 - 1] = H(t, κ)` for κ = k0 + 1, ..., k1
+            H = np.cumsum(D, axis=1)
+            H += H_carry[:k1, None]
+            H_carry[:k1] = H[:, -1]
+
+            # `sum_H[τ - 1, κ - k0 - 1] = ΣH(τ, κ)` for τ = 1, ..., k1 - 1
+            sum_H = np.cumsum(H[:-1], axis=0)
+            taus = np.arange(1, k1)[:, None].astype(self.dtype)
+            kappas = np.arange(k0 + 1, k1 + 1)[None, :].astype(self.dtype)
+            sum_V_tau = sum_V[1:k1, None]
+            sum_V_kappa = sum_V[None, k0 + 1 : k1 + 1]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                A = 2 / kappas * (sum_H - sum_V_tau)
+                B = np.where(taus > 1, 2 * (kappas - taus) / kappas / (taus - 1) * sum_V_tau, 0)
+                C = np.where(kappas - taus > 1, 2 * taus / kappas / (kappas - taus - 1) * (sum_V_kappa - sum_H), 0)
+            Q = A - B - C
+            Q[taus >= kappas] = -np.inf
+            # Row `i` of `Q` is `τ = i + 1` in every block
+            best = _update_argmax(best, Q)
+            k0 = k1
+
+        best_i, best_qhat = best
+        return CandidateChangePoint(index=best_i + 1 + start, qhat=float(best_qhat))
@@ -15,6 +15,7 @@
 # specific language governing permissions and limitations
 # under the License.
 
+from bisect import insort
 from typing import List, Optional, Sequence, SupportsFloat, Type
 
 import numpy as np
@@ -34,8 +35,9 @@ class ChangePointDetector:
 
     def get_change_points(self, series: Sequence[SupportsFloat], start: Optional[int] = None, end: Optional[int] = None) -> List[ChangePoint[GenericStats]]:
         '''Finds change points in `series[start : end]`.'''
+        series = series[start : end]
         if not isinstance(series, np.ndarray):
-            series = np.array(series[start : end], dtype=np.float64)
+            series = np.array(series, dtype=np.float64)
         if not np.issubdtype(series.dtype, np.floating):
             series = series.astype(np.float64, copy=False)
 
@@ -49,10 +51,8 @@ class ChangePointDetector:
                 break
             change_point = self.tester.change_point(candidate, series, intervals)
             if self.tester.is_significant(change_point):
-                # TODO: Consider BST vs sorted array
-                change_points.append(change_point)
                 # Could sort by either start or end for non-intersecting intervals
-                change_points.sort(key=lambda point: point.index)
+                insort(change_points, change_point, key=lambda point: point.index)
             else:
                 break
 
@@ -15,11 +15,14 @@
 # specific language governing permissions and limitations
 # under the License.
 
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional, Type
+from multiprocessing import get_context, shared_memory
+from typing import Dict, List, Optional, Tuple, Type
 
 import numpy as np
 from numpy.typing import NDArray
+from scipy.stats import genpareto
 
 from otava.change_point_divisive.base import (
     BaseStats,
@@ -32,46 +35,378 @@ from otava.change_point_divisive.base import (
 
 @dataclass
 class PermutationStats(BaseStats):
-    '''Statistics for permutation significance test'''
+    '''Statistics for permutation significance test
+
+    permuted_qhats - qhats of the permutations that were run
+    extreme_qhat_perm - number of permuted qhats that are at least as extreme as the qhat of the change point
+    n_perm - number of permutations that were run, less than requested if the test was stopped early'''
     permuted_qhats: NDArray
     extreme_qhat_perm: int
     n_perm: int
 
 
+def _permuted_qhats(
+    series: NDArray, calculator: Type[Calculator], intervals: List[slice], rngs: List[np.random.Generator],
+    qhat: float = np.inf, max_extreme: float = np.inf
+) -> NDArray:
+    '''Returns qhats of the best candidates of `series` permuted within `intervals`, one permutation per generator.
+    Stops early, returning only the qhats computed so far, once more than `max_extreme` of them are `>= qhat`.
+
+    Permutations are evaluated by a calculator of `series` in batches (see `Calculator.get_permuted_qhats`).
+    Shuffling indexes of the points takes the same random numbers as shuffling the points themselves.'''
+    calc = calculator(series)
+    batch = calc.permutations_batch_size()
+    qhats = np.empty(len(rngs))
+    extreme = 0
+    for start in range(0, len(rngs), batch):
+        batch_rngs = rngs[start : start + batch]
+        # Permute points within each interval (cluster)
+        permutations = np.tile(np.arange(len(series)), (len(batch_rngs), 1))
+        for permutation, rng in zip(permutations, batch_rngs):
+            for interval in intervals:
+                rng.shuffle(permutation[interval])
+        qhats[start : start + len(batch_rngs)] = calc.get_permuted_qhats(permutations, intervals)
+        for i in range(start, start + len(batch_rngs)):
+            extreme += qhats[i] >= qhat
+            if extreme > max_extreme:
+                return qhats[: i + 1]
+    return qhats
+
+
+def _permuted_qhats_shared(
+    shared_series: Tuple[str, tuple, str], calculator: Type[Calculator], intervals: List[slice],
+    seeds: List[np.random.SeedSequence], qhat: float, max_extreme: float
+) -> NDArray:
+    '''Worker process entry point of `_permuted_qhats` for a series in shared memory `(name, shape, dtype)`.'''
+    name, shape, dtype = shared_series
+    memory = shared_memory.SharedMemory(name=name)
+    series = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    try:
+        rngs = [np.random.default_rng(seed) for seed in seeds]
+        return _permuted_qhats(series, calculator, intervals, rngs, qhat, max_extreme)
+    finally:
+        # The view must be released before the memory is closed
+        del series
+        memory.close()
+
+
 class PermutationsSignificanceTester(SignificanceTester):
-    def __init__(self, max_pvalue: float, permutations: int, calculator: Type[Calculator], seed: Optional[int]):
+    # Number of permutations computed first for every interval when both `interval_cache` and `early_stop`
+    # are used, the count is doubled until the test is settled
+    _EARLY_STOP_BATCH = 10
+
+    def __init__(
+        self, max_pvalue: float, permutations: int, calculator: Type[Calculator], seed: Optional[int],
+        workers: Optional[int] = None, early_stop: bool = False, interval_cache: bool = False
+    ):
         '''max_pvalue - significance level
         permutations - number of permutations to run to test significance
         calculator - Calculator class to perform permutations (and compute new qhat value)
+        workers - number of worker processes to run permutations in parallel; if `None`, permutations
+                  run in the current process. In parallel mode every permutation has its own random
+                  generator spawned from `seed`, so results are reproducible and do not depend on the
+                  number of workers (but differ from the results of the serial mode).
+        early_stop - stop permuting as soon as the candidate is certain to be insignificant, i.e., once
+                     so many permuted qhats exceed the candidate's qhat that the p-value would be above
+                     `max_pvalue` whatever the remaining permutations give. Significance decisions are the
+                     same as without early stopping, but stats of insignificant change points are based
+                     on fewer permutations (see `PermutationStats.n_perm`).
+        interval_cache - permute every interval with its own random generators, and keep the permuted qhats
+                         of every interval of the series between the calls. The permuted qhat of the whole
+                         series is the maximum over the intervals, and an interval has the same permuted qhats
+                         until it is split. So only the two new intervals of the last split are permuted
+                         in every iteration of `ChangePointDetector`. Results are reproducible for a given
+                         `seed`, but differ from the results without the cache.
         '''
         super().__init__(max_pvalue)
+        assert workers is None or workers > 0, f"workers={workers} must be positive"
         self.permutations = permutations
         self.calculator = calculator
         self.seed = seed
         self.rng = np.random.default_rng(seed)
+        self.workers = workers
+        self.early_stop = early_stop
+        self.interval_cache = interval_cache
+        self._seed_sequence = np.random.SeedSequence(seed)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Permuted qhats of the intervals of (a copy of) the last tested series, keyed by (start, stop) of the interval
+        self._cached_series: Optional[NDArray] = None
+        self._interval_qhats: Dict[Tuple[int, int], NDArray] = {}
+
+    def close(self):
+        '''Shuts down worker processes, if any were started.'''
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _parallel_permuted_qhats(
+        self, series: NDArray, intervals: List[slice], seeds: List[np.random.SeedSequence], qhat: float,
+        max_extreme: float
+    ) -> NDArray:
+        '''Runs the permutations in worker processes. The series is passed to the workers through shared
+        memory, so it is not pickled for every task; every worker copies it only to permute it.
+
+        With early stopping, every worker stops on its own once it has seen more than `max_extreme`
+        extreme qhats, since then the total count of them is above `max_extreme` as well.'''
+        if self._pool is None:
+            # Not forked, the tester might run in one of many threads
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        memory = shared_memory.SharedMemory(create=True, size=max(series.nbytes, 1))
+        try:
+            np.ndarray(series.shape, dtype=series.dtype, buffer=memory.buf)[...] = series
+            shared_series = (memory.name, series.shape, series.dtype.str)
+            chunks = [seeds[i::self.workers] for i in range(min(self.workers, len(seeds)))]
+            futures = [
+                self._pool.submit(
+                    _permuted_qhats_shared, shared_series, self.calculator, intervals, chunk, qhat, max_extreme
+                )
+                for chunk in chunks
+            ]
+            qhats = np.empty(len(seeds))
+            computed = np.zeros(len(seeds), dtype=bool)
+            for i, future in enumerate(futures):
+                result = future.result()
+                qhats[i::self.workers][: len(result)] = result
+                computed[i::self.workers][: len(result)] = True
+            return qhats[computed]
+        finally:
+            memory.close()
+            memory.unlink()
+
+    def _get_interval_qhats(self, series: NDArray, interval: Tuple[int, int], count: int) -> NDArray:
+        '''Returns the first `count` permuted qhats of `series[start:stop]` alone, computing only those
+        that are not cached yet. The j-th permutation of the interval is done by a generator seeded
+        with `(seed, start, stop, j)`, so it is the same whenever the interval is tested.'''
+        start, stop = interval
+        qhats = self._interval_qhats.get(interval, np.empty(0))
+        if len(qhats) < count:
+            seeds = [
+                np.random.SeedSequence(self._seed_sequence.entropy, spawn_key=(start, stop, j))
+                for j in range(len(qhats), count)
+            ]
+            whole = [slice(None, None)]
+            if self.workers is None:
+                rngs = [np.random.default_rng(seed) for seed in seeds]
+                new_qhats = _permuted_qhats(series[start:stop], self.calculator, whole, rngs)
+            else:
+                new_qhats = self._parallel_permuted_qhats(series[start:stop], whole, seeds, np.inf, np.inf)
+            qhats = np.concatenate([qhats, new_qhats])
+            self._interval_qhats[interval] = qhats
+        return qhats[:count]
+
+    def _cached_permuted_qhats(
+        self, series: NDArray, intervals: List[slice], qhat: float, max_extreme: float
+    ) -> NDArray:
+        '''Returns permuted qhats of the series as the maximum of the permuted qhats of its intervals.
+        With early stopping, the permuted qhats of the intervals are computed in growing batches.'''
+        if self._cached_series is None or not np.array_equal(self._cached_series, series):
+            self._cached_series = series.copy()
+            self._interval_qhats = {}
+        keys = [interval.indices(len(series))[:2] for interval in intervals]
+        keys = [key for key in keys if key[1] - key[0] > 1]
+        # Intervals that were split are gone for good
+        self._interval_qhats = {key: self._interval_qhats[key] for key in keys if key in self._interval_qhats}
+
+        count = self.permutations if max_extreme == np.inf else min(self.permutations, self._EARLY_STOP_BATCH)
+        while True:
+            qhats = np.max([self._get_interval_qhats(series, key, count) for key in keys], axis=0)
+            extreme = np.cumsum(qhats >= qhat)
+            if extreme[-1] > max_extreme:
+                return qhats[: np.argmax(extreme > max_extreme) + 1]
+            if count == self.permutations:
+                return qhats
+            count = min(2 * count, self.permutations)
 
     def change_point(self, candidate: CandidateChangePoint, series: NDArray, intervals: List[slice]) -> ChangePoint[PermutationStats]:
         '''Perform permutation test within candidate cluster'''
 
         # 1. Find permutated Qhats
-        qhats = np.empty(self.permutations)
-        for i in range(self.permutations):
-            # Permute points within each interval (cluster)
-            rand_series = series.copy()
-            for interval in intervals:
-                seg = rand_series[interval]
-                self.rng.shuffle(seg)
-            rand_calc = self.calculator(rand_series)
-            rand_candidate = rand_calc.get_next_candidate(intervals)
-            qhats[i] = rand_candidate.qhat
+        # The p-value is above `max_pvalue` for sure once more than `max_extreme` permuted qhats are extreme
+        max_extreme = np.inf
+        if self.early_stop:
+            max_extreme = np.floor(self.max_pvalue * (self.permutations + 1))
+            # Guard against rounding of the product, the decision must be the same as in `is_significant`
+            while max_extreme / (self.permutations + 1) > self.max_pvalue:
+                max_extreme -= 1
+            while (max_extreme + 1) / (self.permutations + 1) <= self.max_pvalue:
+                max_extreme += 1
+        if self.interval_cache:
+            qhats = self._cached_permuted_qhats(series, intervals, candidate.qhat, max_extreme)
+        elif self.workers is None:
+            qhats = _permuted_qhats(
+                series, self.calculator, intervals, [self.rng] * self.permutations, candidate.qhat, max_extreme
+            )
+        else:
+            seeds = self._seed_sequence.spawn(self.permutations)
+            qhats = self._parallel_permuted_qhats(series, intervals, seeds, candidate.qhat, max_extreme)
 
         # 2. Estimate p-value
         extreme_qhat_perm = np.sum(qhats >= candidate.qhat)
-        pval = extreme_qhat_perm / (self.permutations + 1)
+        pval = extreme_qhat_perm / (len(qhats) + 1)
         stats = PermutationStats(
             pvalue=pval,
             permuted_qhats=qhats,
             extreme_qhat_perm=extreme_qhat_perm,
-            n_perm=self.permutations
+            n_perm=len(qhats)
         )
         return ChangePoint.from_candidate(candidate, stats)
+
+
+@dataclass
+class FittedNullStats(BaseStats):
+    '''Statistics for significance test with fitted null distribution
+
+    qhats - qhats of the candidate normalized by the scale of each interval (not normalized for constant intervals)
+    sfs - probabilities that the normalized qhat of a permutation of each interval is at least `qhats`'''
+    qhats: NDArray
+    sfs: NDArray
+
+
+@dataclass
+class NullDistribution:
+    '''Distribution of normalized permuted qhats: the empirical distribution of the calibration `samples`
+    up to `threshold`, and above it a generalized Pareto distribution with `shape` and `scale` of the
+    excesses over `threshold`, which holds `tail_fraction` of the mass. Without a fitted tail (`scale` is 0),
+    the empirical distribution is used everywhere.
+
+    Qhat is a maximum of sums, so its tail is at most exponential. A negative shape, which bounds the tail
+    and gives p-values of 0 just above the largest samples, comes from too few samples rather than from
+    the data, and an exponential tail (shape 0) is fitted instead.'''
+    samples: NDArray
+    threshold: float
+    tail_fraction: float
+    shape: float
+    scale: float
+
+    # Fraction of the samples the tail is fitted to, and the least number of them that is enough for a fit
+    TAIL_FRACTION = 0.1
+    MIN_TAIL_SAMPLES = 10
+
+    @classmethod
+    def fit(cls, samples: NDArray) -> 'NullDistribution':
+        samples = np.sort(samples)
+        tail = int(len(samples) * cls.TAIL_FRACTION)
+        threshold = samples[len(samples) - tail - 1]
+        excesses = samples[len(samples) - tail :] - threshold
+        if tail >= cls.MIN_TAIL_SAMPLES and np.ptp(excesses) > 0:
+            shape, _, scale = genpareto.fit(excesses, floc=0)
+            if shape < 0:
+                shape, scale = 0.0, np.mean(excesses)
+            if np.isfinite(shape) and np.isfinite(scale) and scale > 0:
+                return cls(samples, threshold, tail / len(samples), shape, scale)
+        # E.g., all permutations of 2 points have the same qhat
+        return cls(samples, samples[-1], 0.0, 0.0, 0.0)
+
+    def sf(self, qhat: float) -> float:
+        '''Returns the probability that a normalized permuted qhat is at least `qhat`'''
+        if qhat <= self.threshold or self.scale == 0:
+            return (len(self.samples) - np.searchsorted(self.samples, qhat, side="left")) / len(self.samples)
+        return self.tail_fraction * genpareto.sf(qhat - self.threshold, self.shape, scale=self.scale)
+
+
+class FittedNullSignificanceTester(SignificanceTester):
+    '''Approximates the null distribution of qhat instead of running permutations for every candidate.
+
+    Qhat of an interval is proportional to `scale ** power` of its values, where `scale` is the square root
+    of the total variance. So the null distribution of `qhat / scale ** power` depends mostly on the length
+    of the interval. It is estimated from the normalized qhats of permutations of intervals of a similar
+    length (lengths are grouped into buckets of a quarter of an octave) and cached. P-values of interest are
+    far in the tail, beyond the reach of the calibration samples, and a distribution fitted to all of them
+    doesn't extrapolate there. So only the body of the distribution is empirical, and its upper tail is
+    a generalized Pareto distribution fitted to the largest samples (the peaks-over-threshold method).
+    As the qhat of the series is the maximum over its intervals, the p-value of a candidate with qhat `q` is
+
+                        pvalue = 1 - Π (1 - S_i(q / scale_i ** power)),
+
+    where `S_i` is the survival function of the null distribution for interval `i`.
+
+    A bucket is calibrated with `min_calibration_permutations` permutations of its first interval. While
+    the p-value of a candidate is between `max_pvalue / LOWER_CALIBRATION_MARGIN` and
+    `max_pvalue * UPPER_CALIBRATION_MARGIN`, i.e., the decision depends on the accuracy of the tail,
+    the buckets of its intervals get as many permutations of these intervals again, up to
+    `calibration_permutations`. Fitted to a few samples, the tail is more often too light than too heavy,
+    hence the wider margin below `max_pvalue`. Once the buckets are calibrated, each
+    candidate costs a few evaluations of their distributions, but p-values are approximate, especially
+    in the far tail.'''
+
+    # P-values within these factors below and above `max_pvalue` make the tester extend the calibration
+    LOWER_CALIBRATION_MARGIN = 100
+    UPPER_CALIBRATION_MARGIN = 10
+
+    def __init__(
+        self, max_pvalue: float, calculator: Type[Calculator], seed: Optional[int],
+        calibration_permutations: int = 1000, power: float = 1., min_calibration_permutations: int = 200
+    ):
+        '''max_pvalue - significance level
+        calculator - Calculator class to compute qhats of permuted intervals for calibration
+        calibration_permutations - maximal number of permutations to fit the null distribution for an interval
+                                   length; the tail is fitted to a tenth of them, which needs at least 100
+        power - power of distances used by the calculator
+        min_calibration_permutations - number of permutations to start the calibration of an interval length with
+        '''
+        super().__init__(max_pvalue)
+        assert calibration_permutations > 1, "At least 2 permutations are needed to fit the distribution"
+        self.calculator = calculator
+        self.calibration_permutations = calibration_permutations
+        self.min_calibration_permutations = min(min_calibration_permutations, calibration_permutations)
+        self.power = power
+        self.rng = np.random.default_rng(seed)
+        # Normalized permuted qhats and the distributions fitted to them, keyed by bucket of the interval length
+        self._samples: Dict[int, NDArray] = {}
+        self._fitted: Dict[int, NullDistribution] = {}
+
+    @staticmethod
+    def _bucket(length: int) -> int:
+        return int(np.round(4 * np.log2(length)))
+
+    def _calibrate(self, bucket: int, values: NDArray, scale: float, permutations: int):
+        '''Adds normalized qhats of `permutations` permutations of `values` to the samples of the bucket
+        and fits its null distribution again'''
+        qhats = _permuted_qhats(values, self.calculator, [slice(None, None)], [self.rng] * permutations)
+        samples = np.concatenate([self._samples.get(bucket, np.empty(0)), qhats / scale ** self.power])
+        self._samples[bucket] = samples
+        self._fitted[bucket] = NullDistribution.fit(samples)
+
+    def change_point(self, candidate: CandidateChangePoint, series: NDArray, intervals: List[slice]) -> ChangePoint[FittedNullStats]:
+        '''Estimates p-value of the candidate from the fitted null distributions of its intervals'''
+        # (normalized qhat, bucket, values, scale) for every interval of at least 2 points,
+        # bucket is None for constant intervals
+        tested = []
+        for interval in intervals:
+            values = series[interval]
+            if len(values) <= 1:
+                continue
+            scale = np.sqrt(np.sum(np.var(values, axis=0)))
+            if scale == 0:
+                tested.append((candidate.qhat, None, values, scale))
+                continue
+            bucket = self._bucket(len(values))
+            if bucket not in self._fitted:
+                self._calibrate(bucket, values, scale, self.min_calibration_permutations)
+            tested.append((candidate.qhat / scale ** self.power, bucket, values, scale))
+
+        while True:
+            sfs = np.array([
+                # Permutations of constant values have qhat 0, i.e., all mass of the distribution is at 0
+                (1.0 if qhat <= 0 else 0.0) if bucket is None else self._fitted[bucket].sf(qhat)
+                for qhat, bucket, _, _ in tested
+            ])
+            # Without intervals of at least 2 points nothing can be split
+            pvalue = 1 - np.prod(1 - sfs) if len(sfs) > 0 else 1.0
+            lower = self.max_pvalue / self.LOWER_CALIBRATION_MARGIN
+            upper = self.max_pvalue * self.UPPER_CALIBRATION_MARGIN
+            if not lower < pvalue < upper:
+                break
+            extended = set()
+            for _, bucket, values, scale in tested:
+                if bucket is None or bucket in extended:
+                    continue
+                samples = len(self._samples[bucket])
+                if samples < self.calibration_permutations:
+                    self._calibrate(bucket, values, scale, min(samples, self.calibration_permutations - samples))
+                    extended.add(bucket)
+            if not extended:
+                break
+
+        stats = FittedNullStats(pvalue=pvalue, qhats=np.array([qhat for qhat, _, _, _ in tested]), sfs=sfs)
+        return ChangePoint.from_candidate(candidate, stats)
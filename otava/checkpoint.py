@@ -0,0 +1,131 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from otava.data_selector import DataSelector
+from otava.series import AnalysisOptions, AnalyzedSeries, Series
+from otava.snapshot import SnapshotError, read_snapshot, save_snapshot
+
+
+class CheckpointStore:
+    """
+    Keeps analyzed series on disk between runs of the analysis, so that a run only needs to analyze
+    the data points added since the previous one.
+
+    There is one checkpoint per test, branch, selected metrics and attributes, and analysis options.
+    It holds the data points selected by the last run together with their change points and weak change
+    points, which is the state `AnalyzedSeries.append` needs to recompute only the tail of the series.
+    A checkpoint is only used if the current selection starts with the same data points, otherwise,
+    e.g., if older points fall out of the selected range, the series is analyzed from scratch.
+    Checkpoints are stored as binary snapshots, see `otava.snapshot`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def supports(options: AnalysisOptions) -> bool:
+        """Only change points of the windowed algorithm can be updated incrementally."""
+        return not options.orig_edivisive and not options.multivariate
+
+    def path(self, test_name: str, selector: DataSelector, options: AnalysisOptions) -> Path:
+        key = json.dumps(
+            {
+                "test": test_name,
+                "branch": selector.branch,
+                "metrics": selector.metrics,
+                "attributes": selector.attributes,
+                "options": options.to_json(execution=False),
+            },
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        name = re.sub(r"[^\w.-]", "_", test_name)
+        return self.directory / f"{name}-{digest}.snapshot"
+
+    def load(
+        self, test_name: str, selector: DataSelector, options: AnalysisOptions
+    ) -> Optional[AnalyzedSeries]:
+        """Returns the checkpointed series, or None if there is no usable checkpoint."""
+        path = self.path(test_name, selector, options)
+        if not self.supports(options) or not path.exists():
+            return None
+        try:
+            # Not memory-mapped, because the file is replaced when the checkpoint is saved again
+            return read_snapshot(path, memory_map=False)
+        except OSError as err:
+            logging.warning(f"Ignoring unreadable checkpoint {path}: {err}")
+            return None
+        except SnapshotError as err:
+            logging.warning(f"Ignoring unreadable checkpoint {path}: {err.message}")
+            return None
+
+    def save(self, selector: DataSelector, analyzed_series: AnalyzedSeries):
+        if not self.supports(analyzed_series.options):
+            return
+        path = self.path(analyzed_series.test_name(), selector, analyzed_series.options)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # An interrupted run never leaves a truncated checkpoint behind
+        save_snapshot(analyzed_series, path)
+
+    @staticmethod
+    def continues(analyzed_series: AnalyzedSeries, series: Series) -> bool:
+        """
+        Checks if `series` continues `analyzed_series`, i.e., has the same metrics and attributes,
+        and starts with the same data points.
+        """
+        length = analyzed_series.len()
+        return (
+            length > 0
+            and len(series.time) >= length
+            and set(series.data.keys()) == set(analyzed_series.metric_names())
+            and set(series.attributes.keys()) == set(analyzed_series.attributes())
+            and np.array_equal(series.time[:length], analyzed_series.time())
+            and all(
+                np.array_equal(values[:length], analyzed_series.data(metric), equal_nan=True)
+                for metric, values in series.data.items()
+            )
+        )
+
+    @staticmethod
+    def append(analyzed_series: AnalyzedSeries, series: Series) -> bool:
+        """
+        Appends the data points of `series` after the analyzed ones to `analyzed_series` and updates
+        its change points. Returns False if `series` doesn't continue `analyzed_series`, in which case
+        `analyzed_series` is left unchanged.
+        """
+        if not CheckpointStore.continues(analyzed_series, series):
+            return False
+        # Metric properties come from the configuration, which might have changed since the checkpoint
+        analyzed_series.series().metrics = series.metrics
+        length = analyzed_series.len()
+        if len(series.time) == length:
+            return True
+        analyzed_series.append(
+            time=series.time[length:].tolist(),
+            new_data={metric: values[length:] for metric, values in series.data.items()},
+            attributes={name: values[length:] for name, values in series.attributes.items()},
+        )
+        return True
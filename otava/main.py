@@ -16,17 +16,24 @@
 # under the License.
 
 import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import configargparse as argparse
 import pytz
 from slack_sdk import WebClient
 
 from otava import config
+from otava.analysis import CALCULATORS
 from otava.attributes import get_back_links
 from otava.bigquery import BigQuery, BigQueryError
+from otava.cache import DEFAULT_MAX_SIZE, AnalysisCache
+from otava.checkpoint import CheckpointStore
 from otava.config import Config
 from otava.data_selector import DataSelector
 from otava.grafana import Annotation, Grafana, GrafanaError
@@ -34,7 +41,7 @@ from otava.graphite import GraphiteError
 from otava.importer import DataImportError, Importers
 from otava.postgres import Postgres, PostgresError
 from otava.report import Report, ReportType
-from otava.series import AnalysisOptions, AnalyzedSeries
+from otava.series import AnalysisOptions, AnalyzedSeries, Series
 from otava.slack import NotificationError, SlackNotifier
 from otava.test_config import (
     BigQueryTestConfig,
@@ -45,6 +52,12 @@ from otava.test_config import (
 )
 from otava.util import DateFormatError, interpolate, parse_datetime
 
+DEFAULT_FETCH_WORKERS = 8
+# Spawning worker processes costs more than analyzing a few small tests, so they are started only on request
+DEFAULT_ANALYSIS_WORKERS = 1
+
+LOG_FORMAT = "%(levelname)s: %(message)s"
+
 
 @dataclass
 class OtavaError(Exception):
@@ -110,22 +123,141 @@ class Otava:
         for metric_name in importer.fetch_all_metric_names(test):
             print(metric_name)
 
+    def fetch(
+        self,
+        test: TestConfig,
+        selector: DataSelector,
+        options: AnalysisOptions,
+        checkpoints: Optional[CheckpointStore] = None,
+    ) -> Tuple[Series, Optional[AnalyzedSeries]]:
+        """
+        Fetches the data points of the test. If the test has a checkpoint matching its data, returns
+        the checkpoint as well, so that only the data points added since the checkpoint are analyzed.
+        """
+        series = self.__importers.get(test).fetch_data(test, selector)
+        if checkpoints is None:
+            return series, None
+        checkpoint = checkpoints.load(test.name, selector, options)
+        if checkpoint is None:
+            return series, None
+        if not checkpoints.continues(checkpoint, series):
+            # E.g., the selected range starts later than the checkpoint, or old data points were changed
+            logging.info(f"Checkpoint of test {test.name} doesn't match its data, analyzing from scratch")
+            return series, None
+        logging.info(f"Resuming analysis of test {test.name} from checkpoint")
+        return series, checkpoint
+
     def analyze(
         self,
         test: TestConfig,
         selector: DataSelector,
         options: AnalysisOptions,
         report_type: ReportType,
+        checkpoints: Optional[CheckpointStore] = None,
+        cache: Optional[AnalysisCache] = None,
     ) -> AnalyzedSeries:
-        importer = self.__importers.get(test)
-        series = importer.fetch_data(test, selector)
-        analyzed_series = series.analyze(options)
-        change_points = analyzed_series.change_points_by_time
-        report = Report(series, change_points)
-        produced_report = report.produce_report(test.name, report_type)
-        print(produced_report)
+        series, checkpoint = self.fetch(test, selector, options, checkpoints)
+        analyzed_series = analyze_series(series, options, checkpoint, cache, report_metrics(series, report_type))
+        if checkpoints is not None:
+            checkpoints.save(selector, analyzed_series)
+        self.print_report(test, analyzed_series, report_type)
         return analyzed_series
 
+    def analyze_tests(
+        self,
+        tests: List[TestConfig],
+        selector: DataSelector,
+        options: AnalysisOptions,
+        report_type: ReportType,
+        checkpoints: Optional[CheckpointStore] = None,
+        cache: Optional[AnalysisCache] = None,
+        fetch_workers: int = DEFAULT_FETCH_WORKERS,
+        analysis_workers: int = DEFAULT_ANALYSIS_WORKERS,
+    ) -> Iterator[Tuple[TestConfig, Future]]:
+        """
+        Analyzes many tests concurrently. The data of the tests are fetched by a pool of
+        `fetch_workers` threads, so the fetches of the following tests overlap with the analysis of the
+        previous ones. The change points are computed by the fetching threads, or, if `analysis_workers`
+        is more than 1, by a pool of that many processes.
+
+        Yields the tests in the given order, each together with the future of its analyzed series,
+        after printing its report. The future raises the error the test failed with, if any,
+        e.g. DataImportError, without affecting the other tests.
+        """
+        with ExitStack() as stack:
+            fetch_pool = stack.enter_context(ThreadPoolExecutor(max_workers=fetch_workers))
+            analysis_pool = None
+            if len(tests) > 1 and analysis_workers > 1:
+                # Forking is unsafe while the fetching threads are running
+                analysis_pool = stack.enter_context(
+                    ProcessPoolExecutor(
+                        max_workers=analysis_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        # Spawned processes don't inherit the logging configuration
+                        initializer=configure_logging,
+                        initargs=(logging.getLogger().level,),
+                    )
+                )
+
+            def run(test: TestConfig) -> AnalyzedSeries:
+                series, checkpoint = self.fetch(test, selector, options, checkpoints)
+                metrics = report_metrics(series, report_type)
+                return save(analyze_series(series, options, checkpoint, cache, metrics))
+
+            def save(analyzed_series: AnalyzedSeries) -> AnalyzedSeries:
+                if checkpoints is not None:
+                    checkpoints.save(selector, analyzed_series)
+                return analyzed_series
+
+            def submit(fetched: Future, analyzed: Future):
+                # Called when the data of a test are fetched. The analysis is only submitted to the pool,
+                # so the fetching thread doesn't wait for it and can fetch the next test
+                if not analyzed.set_running_or_notify_cancel():
+                    return
+                try:
+                    series, checkpoint = fetched.result()
+                    metrics = report_metrics(series, report_type)
+                    analysis = analysis_pool.submit(analyze_series, series, options, checkpoint, cache, metrics)
+                except BaseException as err:
+                    analyzed.set_exception(err)
+                    return
+                analyses.append(analysis)
+                analysis.add_done_callback(partial(finish, analyzed))
+
+            def finish(analyzed: Future, analysis: Future):
+                try:
+                    analyzed.set_result(save(analysis.result()))
+                except BaseException as err:
+                    analyzed.set_exception(err)
+
+            fetches, analyses = [], []
+            if analysis_pool is None:
+                futures = [fetch_pool.submit(run, test) for test in tests]
+            else:
+                futures = [Future() for _ in tests]
+                for test, future in zip(tests, futures):
+                    fetches.append(fetch_pool.submit(self.fetch, test, selector, options, checkpoints))
+                    fetches[-1].add_done_callback(partial(submit, analyzed=future))
+            try:
+                for test, future in zip(tests, futures):
+                    if future.exception() is None:
+                        self.print_report(test, future.result(), report_type)
+                    yield test, future
+            finally:
+                # Don't start analyzing the remaining tests if the caller stopped early, e.g. on an error
+                for future in futures + fetches + analyses:
+                    future.cancel()
+
+    @staticmethod
+    def print_report(test: TestConfig, analyzed_series: AnalyzedSeries, report_type: ReportType):
+        metrics = report_metrics(analyzed_series.series(), report_type)
+        if metrics is None:
+            change_points = analyzed_series.change_points_by_time
+        else:
+            change_points = analyzed_series.change_points_by_time_of(metrics)
+        report = Report(analyzed_series.series(), change_points)
+        print(report.produce_report(test.name, report_type))
+
     def __get_grafana(self) -> Grafana:
         if self.__grafana is None:
             self.__grafana = Grafana(self.__conf.grafana)
@@ -289,7 +421,7 @@ class Otava:
                 importer = self.__importers.get(test)
                 series = importer.fetch_data(test)
                 for metric, metric_data in series.data.items():
-                    if not metric_data:
+                    if len(metric_data) == 0:
                         logging.warning(f"Test's metric does not have data: {name} {metric}")
             except Exception as err:
                 logging.error(f"Invalid test definition: {name}\n{repr(err)}\n")
@@ -433,6 +565,108 @@ def setup_analysis_options_parser(parser: argparse.ArgumentParser):
         help="use the original edivisive algorithm with no windowing "
         "and weak change points analysis improvements",
     )
+    parser.add_argument(
+        "--multivariate",
+        action="store_true",
+        default=None,
+        dest="multivariate",
+        help="analyze all metrics of a test jointly with the original edivisive algorithm, "
+        "reporting one change point for a change that affects several metrics at once",
+    )
+    parser.add_argument(
+        "--calculator",
+        choices=list(CALCULATORS),
+        default="pair_distance",
+        dest="calculator",
+        help="the method used to find candidate change points; "
+        "'blocked' finds the same candidates as 'pair_distance' "
+        "without keeping a quadratic matrix of distances in memory",
+    )
+    parser.add_argument(
+        "--permutation-workers",
+        type=int,
+        default=None,
+        dest="permutation_workers",
+        metavar="COUNT",
+        help="the number of processes running the permutation tests of --orig-edivisive "
+        "and --multivariate in parallel",
+    )
+    parser.add_argument(
+        "--fitted-null",
+        action="store_true",
+        default=None,
+        dest="fitted_null",
+        help="approximate P-values of --orig-edivisive and --multivariate by a distribution fitted to "
+        "permutations of intervals of a similar length instead of running permutation tests for every "
+        "candidate; resolves P-values below the reach of the permutation tests, but less exactly",
+    )
+    parser.add_argument(
+        "--fixed-stride-split",
+        action="store_true",
+        default=None,
+        dest="fixed_stride_split",
+        help="start the windows of the split step at fixed offsets, so they can be analyzed "
+        "in parallel; finds almost the same change points as the default mode",
+    )
+    parser.add_argument(
+        "--split-workers",
+        type=int,
+        default=None,
+        dest="split_workers",
+        metavar="COUNT",
+        help="the number of processes analyzing the windows of --fixed-stride-split in parallel; "
+        "requires --fixed-stride-split",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        dest="jobs",
+        metavar="COUNT",
+        help="the number of metrics of a test analyzed in parallel",
+    )
+    parser.add_argument(
+        "--jobs-backend",
+        choices=["process", "thread"],
+        default=None,
+        dest="jobs_backend",
+        help="run the parallel --jobs in processes (default) or threads",
+    )
+
+
+def configure_logging(level: int):
+    logging.basicConfig(format=LOG_FORMAT, level=level)
+
+
+def report_metrics(series: Series, report_type: ReportType) -> Optional[List[str]]:
+    """Returns the metrics whose change points the report shows, or None if it shows all of them."""
+    if report_type == ReportType.REGRESSIONS_ONLY:
+        # Changes of metrics without a direction are never regressions
+        return [metric for metric in series.data.keys() if series.metrics[metric].direction != 0]
+    return None
+
+
+def analyze_series(
+    series: Series,
+    options: AnalysisOptions,
+    checkpoint: Optional[AnalyzedSeries] = None,
+    cache: Optional[AnalysisCache] = None,
+    metrics: Optional[List[str]] = None,
+) -> AnalyzedSeries:
+    """
+    Finds the change points of the fetched series, continuing the analysis of the checkpoint if given.
+    Otherwise, returns the cached change points of the series if there are any.
+
+    Only the change points of `metrics`, by default of all metrics, are computed ahead. The others
+    are computed when they are needed, e.g., when the series is cached or checkpointed.
+    """
+    if checkpoint is None:
+        analyzed_series = series.analyze(options) if cache is None else cache.analyze(series, options)
+        # Change points are computed lazily, but this runs in the analysis worker processes
+        analyzed_series.compute(metrics)
+        return analyzed_series
+    CheckpointStore.append(checkpoint, series)
+    return checkpoint
 
 
 def analysis_options_from_args(args: argparse.Namespace) -> AnalysisOptions:
@@ -445,6 +679,24 @@ def analysis_options_from_args(args: argparse.Namespace) -> AnalysisOptions:
         conf.window_len = args.window
     if args.orig_edivisive is not None:
         conf.orig_edivisive = args.orig_edivisive
+    if args.multivariate is not None:
+        conf.multivariate = args.multivariate
+    if args.calculator is not None:
+        conf.calculator = args.calculator
+    if args.permutation_workers is not None:
+        conf.permutation_workers = args.permutation_workers
+    if args.fitted_null is not None:
+        conf.fitted_null = args.fitted_null
+    if args.fixed_stride_split is not None:
+        conf.fixed_stride_split = args.fixed_stride_split
+    if args.split_workers is not None:
+        if not conf.fixed_stride_split:
+            raise OtavaError("--split-workers requires --fixed-stride-split")
+        conf.split_workers = args.split_workers
+    if args.jobs is not None:
+        conf.jobs = args.jobs
+    if args.jobs_backend is not None:
+        conf.jobs_backend = args.jobs_backend
     return conf
 
 
@@ -522,6 +774,45 @@ def create_otava_cli_parser() -> argparse.ArgumentParser:
     )
     setup_data_selector_parser(analyze_parser)
     setup_analysis_options_parser(analyze_parser)
+    analyze_parser.add_argument(
+        "--checkpoint-dir",
+        help="keep the analyzed series of each test in DIR and only analyze the data points "
+        "added since the previous run; applies to the default windowed algorithm",
+        metavar="DIR",
+        dest="checkpoint_dir",
+    )
+    analyze_parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        default=DEFAULT_FETCH_WORKERS,
+        help="the number of tests whose data are fetched concurrently",
+        metavar="COUNT",
+        dest="fetch_workers",
+    )
+    analyze_parser.add_argument(
+        "--analysis-workers",
+        type=int,
+        default=DEFAULT_ANALYSIS_WORKERS,
+        help="the number of processes analyzing the fetched tests in parallel; with 1, the tests "
+        "are analyzed in the current process",
+        metavar="COUNT",
+        dest="analysis_workers",
+    )
+    analyze_parser.add_argument(
+        "--cache-dir",
+        help="keep the change points found in DIR and reuse them when the same data are analyzed "
+        "with the same options again; the directory can be shared by concurrent runs",
+        metavar="DIR",
+        dest="cache_dir",
+    )
+    analyze_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+        help="the maximum size of --cache-dir in MB; the least recently used results are evicted first",
+        metavar="MB",
+        dest="cache_size",
+    )
 
     remove_annotations_parser = subparsers.add_parser(
         "remove-annotations",
@@ -544,7 +835,7 @@ def create_otava_cli_parser() -> argparse.ArgumentParser:
 
 
 def script_main(conf: Config = None, args: List[str] = None):
-    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+    configure_logging(logging.INFO)
     parser = create_otava_cli_parser()
 
     try:
@@ -573,13 +864,22 @@ def script_main(conf: Config = None, args: List[str] = None):
             data_selector = data_selector_from_args(args)
             options = analysis_options_from_args(args)
             report_type = args.report_type
+            checkpoints = CheckpointStore(args.checkpoint_dir) if args.checkpoint_dir else None
+            cache = AnalysisCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
             tests = otava.get_tests(*args.tests)
             tests_analyzed_series = {test.name: None for test in tests}
-            for test in tests:
+            for test, analysis in otava.analyze_tests(
+                tests,
+                selector=data_selector,
+                options=options,
+                report_type=report_type,
+                checkpoints=checkpoints,
+                cache=cache,
+                fetch_workers=args.fetch_workers,
+                analysis_workers=args.analysis_workers,
+            ):
                 try:
-                    analyzed_series = otava.analyze(
-                        test, selector=data_selector, options=options, report_type=report_type
-                    )
+                    analyzed_series = analysis.result()
                     if update_grafana_flag:
                         if not isinstance(test, GraphiteTestConfig):
                             raise GrafanaError("Not a Graphite test")
@@ -15,6 +15,7 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import threading
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict
@@ -60,22 +61,24 @@ class PostgresError(Exception):
 
 
 class Postgres:
-    __conn = None
     __config = None
+    # Connections can't be shared by threads, so each thread analyzing tests gets its own
+    __local: threading.local
 
     def __init__(self, config: PostgresConfig):
         self.__config = config
+        self.__local = threading.local()
 
     def __get_conn(self) -> pg8000.dbapi.Connection:
-        if self.__conn is None:
-            self.__conn = pg8000.dbapi.Connection(
+        if getattr(self.__local, "conn", None) is None:
+            self.__local.conn = pg8000.dbapi.Connection(
                 host=self.__config.hostname,
                 port=self.__config.port,
                 user=self.__config.username,
                 password=self.__config.password,
                 database=self.__config.database,
             )
-        return self.__conn
+        return self.__local.conn
 
     def fetch_data(self, query: str, params: tuple = None):
         cursor = self.__get_conn().cursor()
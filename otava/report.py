@@ -19,6 +19,7 @@ from collections import OrderedDict
 from enum import Enum, unique
 from typing import List
 
+import numpy as np
 from tabulate import tabulate
 
 from otava.series import ChangePointGroup, Series
@@ -60,8 +61,13 @@ class Report:
             raise OtavaError(f"Unknown report type: {report_type}")
 
     def __format_log(self) -> str:
-        time_column = [format_timestamp(ts) for ts in self.__series.time]
-        table = {"time": time_column, **self.__series.attributes, **self.__series.data}
+        time_column = [format_timestamp(ts) for ts in self.__series.time.tolist()]
+        # Missing values are printed as empty cells
+        data = {
+            metric: [None if np.isnan(value) else value for value in values.tolist()]
+            for metric, values in self.__series.data.items()
+        }
+        table = {"time": time_column, **self.__series.attributes, **data}
         metrics = list(self.__series.data.keys())
         headers = list(
             OrderedDict.fromkeys(
@@ -16,14 +16,32 @@
 # under the License.
 
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import partial
 from itertools import groupby
-from typing import Any, Dict, Iterable, List, Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+)
+
+import numpy as np
 
 from otava.analysis import (
+    CALCULATORS,
     TTestStats,
     compute_change_points,
+    compute_change_points_batch,
+    compute_change_points_multivariate,
     compute_change_points_orig,
     fill_missing,
 )
@@ -36,20 +54,91 @@ class AnalysisOptions:
     max_pvalue: float
     min_magnitude: float
     orig_edivisive: bool
+    multivariate: bool
+    calculator: str
+    permutation_workers: Optional[int]
+    fitted_null: bool
+    fixed_stride_split: bool
+    split_workers: Optional[int]
+    jobs: Optional[int]
+    jobs_backend: str
 
     def __init__(self):
         self.window_len = 50
         self.max_pvalue = 0.001
         self.min_magnitude = 0.0
         self.orig_edivisive = False
-
-    def to_json(self):
-        return {
+        self.multivariate = False
+        self.calculator = "pair_distance"
+        self.permutation_workers = None
+        self.fitted_null = False
+        self.fixed_stride_split = False
+        self.split_workers = None
+        self.jobs = None
+        self.jobs_backend = "process"
+
+    def to_json(self, execution: bool = True):
+        """
+        If `execution` is False, leaves out the options that only affect how the analysis runs,
+        like the number of workers, but not the change points found, e.g. to key stored results.
+        """
+        options_json = {
             "window_len": self.window_len,
             "max_pvalue": self.max_pvalue,
             "min_magnitude": self.min_magnitude,
-            "orig_edivisive": self.orig_edivisive
+            "orig_edivisive": self.orig_edivisive,
+            "multivariate": self.multivariate,
+            "calculator": self.calculator,
+            "fitted_null": self.fitted_null,
+            "fixed_stride_split": self.fixed_stride_split,
         }
+        if execution:
+            options_json.update(
+                {
+                    "permutation_workers": self.permutation_workers,
+                    "split_workers": self.split_workers,
+                    "jobs": self.jobs,
+                    "jobs_backend": self.jobs_backend,
+                }
+            )
+        return options_json
+
+    @classmethod
+    def from_json(cls, options_json) -> "AnalysisOptions":
+        options = cls()
+        options.window_len = options_json["window_len"]
+        options.max_pvalue = options_json["max_pvalue"]
+        options.min_magnitude = options_json["min_magnitude"]
+        options.orig_edivisive = options_json["orig_edivisive"]
+        options.multivariate = options_json.get("multivariate", options.multivariate)
+        options.calculator = options_json.get("calculator", options.calculator)
+        options.permutation_workers = options_json.get("permutation_workers", options.permutation_workers)
+        options.fitted_null = options_json.get("fitted_null", options.fitted_null)
+        options.fixed_stride_split = options_json.get("fixed_stride_split", options.fixed_stride_split)
+        options.split_workers = options_json.get("split_workers", options.split_workers)
+        options.jobs = options_json.get("jobs", options.jobs)
+        options.jobs_backend = options_json.get("jobs_backend", options.jobs_backend)
+        return options
+
+
+def _run_jobs(jobs: List[Callable[[], Any]], options: AnalysisOptions) -> List[Any]:
+    """
+    Runs independent jobs, e.g. analyses of single metrics, and returns their results in the order
+    of the jobs. With `options.jobs`, the jobs run concurrently in a pool of that many threads or
+    processes, depending on `options.jobs_backend`.
+    """
+    if not options.jobs or options.jobs == 1 or len(jobs) <= 1:
+        return [job() for job in jobs]
+    if options.jobs_backend == "thread":
+        executor = ThreadPoolExecutor(max_workers=min(options.jobs, len(jobs)))
+    else:
+        # Forking is unsafe if other threads are running, e.g. when tests are fetched concurrently
+        executor = ProcessPoolExecutor(
+            max_workers=min(options.jobs, len(jobs)), mp_context=multiprocessing.get_context("spawn")
+        )
+    with executor as pool:
+        futures = [pool.submit(job) for job in jobs]
+        return [future.result() for future in futures]
 
 
 @dataclass
@@ -61,7 +150,7 @@ class Metric:
     def __init__(self, direction: int = 1, scale: float = 1.0, unit: str = ""):
         self.direction = direction
         self.scale = scale
-        self.unit = ""
+        self.unit = unit
 
     def to_json(self):
         return {
@@ -150,37 +239,199 @@ class ChangePointGroup:
         }
 
 
+class AttributeColumn(Sequence[Optional[str]]):
+    """
+    Values of an attribute of all data points of a series, dictionary-encoded: every distinct value is
+    stored once in `categories` and each data point keeps the int32 code of its value. Positions of the data
+    points with a given value are found by an inverted index, built on the first lookup.
+
+    Behaves as a read-only list of the values; `extend` appends values.
+    """
+
+    categories: List[Optional[str]]
+    codes: np.ndarray
+
+    def __init__(self, values: Iterable[Optional[str]] = ()):
+        self.categories = []
+        self.__category_codes: Dict[Optional[str], int] = {}
+        self.codes = np.empty(0, dtype=np.int32)
+        self.__index = None
+        self.extend(values)
+
+    def __encode(self, value: Optional[str]) -> int:
+        code = self.__category_codes.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self.__category_codes[value] = code
+        return code
+
+    def extend(self, values: Iterable[Optional[str]]):
+        if isinstance(values, AttributeColumn):
+            # Only the categories need to be encoded, codes are translated by a lookup table
+            table = np.array([self.__encode(value) for value in values.categories], dtype=np.int32)
+            new_codes = table[values.codes]
+        else:
+            new_codes = np.fromiter((self.__encode(value) for value in values), dtype=np.int32)
+        if len(new_codes) > 0:
+            self.codes = np.concatenate((self.codes, new_codes))
+            self.__index = None
+
+    def __iadd__(self, values: Iterable[Optional[str]]) -> "AttributeColumn":
+        self.extend(values)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, (slice, np.ndarray, list)):
+            return self.take(index)
+        return self.categories[self.codes[index]]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (AttributeColumn, list, tuple)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"AttributeColumn({self.tolist()!r})"
+
+    @classmethod
+    def from_codes(cls, categories: List[Optional[str]], codes: np.ndarray) -> "AttributeColumn":
+        """Creates a column from distinct categories and int32 codes, without copying the codes."""
+        column = cls()
+        column.categories = list(categories)
+        column.__category_codes = {value: code for code, value in enumerate(column.categories)}
+        column.codes = codes
+        return column
+
+    def take(self, indexes) -> "AttributeColumn":
+        """Returns the column of values at the given positions (a slice or an array of positions)."""
+        column = AttributeColumn()
+        column.categories = list(self.categories)
+        column.__category_codes = dict(self.__category_codes)
+        column.codes = self.codes[indexes]
+        return column
+
+    def tolist(self) -> List[Optional[str]]:
+        return [self.categories[code] for code in self.codes.tolist()]
+
+    def positions(self, value: Optional[str]) -> np.ndarray:
+        """Returns the sorted positions of the data points with given value."""
+        code = self.__category_codes.get(value)
+        if code is None:
+            return np.empty(0, dtype=np.intp)
+        if self.__index is None:
+            order = np.argsort(self.codes, kind="stable")
+            ends = np.cumsum(np.bincount(self.codes, minlength=len(self.categories)))
+            self.__index = (order, ends)
+        order, ends = self.__index
+        return order[ends[code - 1] if code > 0 else 0 : ends[code]]
+
+
+def _time_array(time: Sequence[float]) -> np.ndarray:
+    """Converts times to an int64 array, or a float64 array if some of them are fractional."""
+    time = np.asarray(time)
+    if time.dtype.kind in "iu":
+        return time.astype(np.int64)
+    time = time.astype(np.float64)
+    if np.all(np.mod(time, 1) == 0):
+        return time.astype(np.int64)
+    return time
+
+
 class Series:
     """
     Stores values of interesting metrics of all runs of
     a fallout test indexed by a single time variable.
     Provides utilities to analyze data e.g. find change points.
+
+    The data is stored in columns: times in an int64 array (float64 if some times are fractional) and
+    values of all metrics in a float64 matrix with a row per metric, where NaN marks a missing value. `data` maps metric names to views of the rows.
+    Attributes are dictionary-encoded, see `AttributeColumn`.
     """
 
     test_name: str
     branch: Optional[str]
-    time: List[int]
+    time: np.ndarray
     metrics: Dict[str, Metric]
-    attributes: Dict[str, List[str]]
-    data: Dict[str, List[float]]
+    attributes: Dict[str, AttributeColumn]
+    values: np.ndarray
 
     def __init__(
         self,
         test_name: str,
         branch: Optional[str],
-        time: List[int],
+        time: Sequence[int],
         metrics: Dict[str, Metric],
-        data: Dict[str, List[float]],
-        attributes: Dict[str, List[str]],
+        data: Dict[str, Sequence[Optional[float]]],
+        attributes: Dict[str, Sequence[Optional[str]]],
     ):
         self.test_name = test_name
         self.branch = branch
-        self.time = time
+        self.time = _time_array(time)
         self.metrics = metrics
-        self.attributes = attributes if attributes else {}
-        self.data = data
+        self.attributes = {name: AttributeColumn(values) for name, values in (attributes or {}).items()}
         assert all(len(x) == len(time) for x in data.values())
+        assert all(len(x) == len(time) for x in self.attributes.values())
+        self.__metric_rows = {metric: row for row, metric in enumerate(data.keys())}
+        self.values = np.empty((len(data), len(self.time)), dtype=np.float64)
+        for row, values in enumerate(data.values()):
+            # None values become NaN
+            self.values[row] = np.asarray(values, dtype=np.float64)
+        self.__time_sorted = None
+
+    @classmethod
+    def from_arrays(
+        cls,
+        test_name: str,
+        branch: Optional[str],
+        time: np.ndarray,
+        metrics: Dict[str, Metric],
+        rows: List[str],
+        values: np.ndarray,
+        attributes: Dict[str, AttributeColumn],
+    ) -> "Series":
+        """
+        Creates a series backed by given arrays without copying them, e.g., memory-mapped arrays.
+        `rows` are the names of the metrics in the rows of `values`.
+        """
+        assert values.shape == (len(rows), len(time))
         assert all(len(x) == len(time) for x in attributes.values())
+        series = cls(test_name, branch, [], metrics, {}, {})
+        series.time = time
+        series.values = values
+        series.attributes = attributes
+        series.__metric_rows = {metric: row for row, metric in enumerate(rows)}
+        return series
+
+    @property
+    def data(self) -> Dict[str, np.ndarray]:
+        return {metric: self.values[row] for metric, row in self.__metric_rows.items()}
+
+    def extend(
+        self,
+        time: Sequence[int],
+        data: Dict[str, Sequence[Optional[float]]],
+        attributes: Dict[str, Sequence[Optional[str]]],
+    ):
+        """
+        Appends data points to the series. Metrics missing in `data` and attributes missing in `attributes`
+        get missing values at the appended points.
+        """
+        assert all(len(x) == len(time) for x in data.values())
+        assert all(len(x) == len(time) for x in attributes.values())
+        new_values = np.full((len(self.__metric_rows), len(time)), np.nan)
+        for metric, values in data.items():
+            new_values[self.__metric_rows[metric]] = np.asarray(values, dtype=np.float64)
+        self.time = np.concatenate((self.time, _time_array(time)))
+        self.values = np.concatenate((self.values, new_values), axis=1)
+        for name, values in self.attributes.items():
+            values.extend(attributes.get(name, [None] * len(time)))
+        self.__time_sorted = None
 
     def attributes_at(self, index: int) -> Dict[str, str]:
         result = {}
@@ -188,86 +439,289 @@ class Series:
             result[k] = v[index]
         return result
 
+    def __is_time_sorted(self) -> bool:
+        if self.__time_sorted is None:
+            self.__time_sorted = bool(np.all(self.time[1:] >= self.time[:-1]))
+        return self.__time_sorted
+
     def find_first_not_earlier_than(self, time: datetime) -> Optional[int]:
         timestamp = time.timestamp()
-        for i, t in enumerate(self.time):
-            if t >= timestamp:
-                return i
-        return None
+        if self.__is_time_sorted():
+            index = int(np.searchsorted(self.time, timestamp, side="left"))
+            return index if index < len(self.time) else None
+        indexes = np.flatnonzero(self.time >= timestamp)
+        return int(indexes[0]) if len(indexes) > 0 else None
+
+    def between(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> "Series":
+        """
+        Returns the series of the data points with `since <= time < until`. The points are found
+        by binary search if the times are sorted.
+        """
+        since = -np.inf if since is None else since.timestamp()
+        until = np.inf if until is None else until.timestamp()
+        if self.__is_time_sorted():
+            start, stop = np.searchsorted(self.time, [since, until], side="left")
+            indexes = slice(int(start), int(stop))
+        else:
+            indexes = np.flatnonzero((self.time >= since) & (self.time < until))
+        return Series(
+            self.test_name,
+            self.branch,
+            self.time[indexes],
+            self.metrics,
+            {metric: values[indexes] for metric, values in self.data.items()},
+            {name: values.take(indexes) for name, values in self.attributes.items()},
+        )
 
     def find_by_attribute(self, name: str, value: str) -> List[int]:
         """Returns the indexes of data points with given attribute value"""
-        result = []
-        for i in range(len(self.time)):
-            if self.attributes_at(i).get(name) == value:
-                result.append(i)
-        return result
+        if name not in self.attributes:
+            return list(range(len(self.time))) if value is None else []
+        return self.attributes[name].positions(value).tolist()
 
     def analyze(self, options: AnalysisOptions = AnalysisOptions()) -> "AnalyzedSeries":
         logging.info(f"Computing change points for test {self.test_name}...")
         return AnalyzedSeries(self, options)
 
 
+class LazyChangePoints(MutableMapping[str, List[ChangePoint]]):
+    """
+    Change points of the metrics of a series, computed on the first access to each metric.
+
+    Looking up a single metric computes only that metric. Iterating over the values or items
+    computes all the missing metrics at once, which is faster than computing them one by one.
+    """
+
+    __metrics: List[str]
+    __change_points: Dict[str, List[ChangePoint]]
+    __compute: Callable[[List[str]], None]
+
+    def __init__(self, metrics: Iterable[str], compute: Callable[[List[str]], None]):
+        """`compute` is called with the list of metrics to compute and must set their change points."""
+        self.__metrics = list(metrics)
+        self.__change_points = {}
+        self.__compute = compute
+
+    def pending(self) -> List[str]:
+        """Returns the metrics whose change points haven't been computed yet."""
+        return [metric for metric in self.__metrics if metric not in self.__change_points]
+
+    def __getitem__(self, metric: str) -> List[ChangePoint]:
+        if metric not in self.__change_points:
+            if metric not in self.__metrics:
+                raise KeyError(metric)
+            self.__compute([metric])
+        return self.__change_points[metric]
+
+    def __setitem__(self, metric: str, change_points: List[ChangePoint]):
+        if metric not in self.__metrics:
+            self.__metrics.append(metric)
+        self.__change_points[metric] = change_points
+
+    def __delitem__(self, metric: str):
+        self.__metrics.remove(metric)
+        self.__change_points.pop(metric, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__metrics)
+
+    def __len__(self) -> int:
+        return len(self.__metrics)
+
+    def __repr__(self) -> str:
+        return f"LazyChangePoints({self.__change_points}, pending={self.pending()})"
+
+    def items(self):
+        self.__compute_pending()
+        return {metric: self.__change_points[metric] for metric in self.__metrics}.items()
+
+    def values(self):
+        self.__compute_pending()
+        return [self.__change_points[metric] for metric in self.__metrics]
+
+    def __compute_pending(self):
+        pending = self.pending()
+        if pending:
+            self.__compute(pending)
+
+
 class AnalyzedSeries:
     """
-    Time series data with computed change points.
+    Time series data with change points.
+
+    The change points of each metric are computed on the first access, so users interested
+    in just a few metrics don't pay for the analysis of the others.
     """
 
     __series: Series
+    __change_points_by_time: Optional[List[ChangePointGroup]]
     options: AnalysisOptions
-    change_points: Dict[str, List[ChangePoint]]
-    change_points_by_time: List[ChangePointGroup]
+    change_points: MutableMapping[str, List[ChangePoint]]
+    weak_change_points: MutableMapping[str, List[ChangePoint]]
     change_points_timestamp: Any
 
-    def __init__(self, series: Series, options: AnalysisOptions, change_points: Dict[str, ChangePoint] = None):
+    def __init__(
+        self,
+        series: Series,
+        options: AnalysisOptions,
+        change_points: Dict[str, List[ChangePoint]] = None,
+        weak_change_points: Dict[str, List[ChangePoint]] = None,
+    ):
         self.__series = series
         self.options = options
         self.change_points_timestamp = datetime.now(tz=timezone.utc)
-        self.change_points = None
+        self.__change_points_by_time = None
+        self.change_points = LazyChangePoints(series.data.keys(), self._compute)
+        self.weak_change_points = LazyChangePoints(series.data.keys(), self._compute)
         if change_points is not None:
-            self.change_points = change_points
-        else:
-            cp, weak_cps = self.__compute_change_points(series, options)
-            self.change_points = cp
-            self.weak_change_points = weak_cps
-        self.change_points_by_time = self.__group_change_points_by_time(series, self.change_points)
+            self.change_points.update(change_points)
+        if weak_change_points is not None:
+            self.weak_change_points.update(weak_change_points)
+
+    @property
+    def change_points_by_time(self) -> List[ChangePointGroup]:
+        if self.__change_points_by_time is None:
+            self.__change_points_by_time = self.__group_change_points_by_time(self.__series, self.change_points)
+        return self.__change_points_by_time
+
+    def change_points_by_time_of(self, metrics: Iterable[str]) -> List[ChangePointGroup]:
+        """
+        Returns the change points of the given metrics grouped by time, like `change_points_by_time`.
+        Only the change points of these metrics are computed.
+        """
+        metrics = list(metrics)
+        self.compute(metrics)
+        return self.__group_change_points_by_time(
+            self.__series, {metric: self.change_points[metric] for metric in metrics}
+        )
+
+    def compute(self, metrics: Optional[Iterable[str]] = None):
+        """
+        Computes the change points of the given metrics, by default of all metrics, unless they have
+        been computed already. Useful to compute them ahead of time, e.g., in a worker process.
+        """
+        if metrics is None:
+            metrics = self.__series.data.keys()
+        pending = set(self.change_points.pending()) | set(self.weak_change_points.pending())
+        metrics = [metric for metric in metrics if metric in pending]
+        if metrics:
+            self._compute(metrics)
+
+    def _compute(self, metrics: List[str]):
+        # Not name-mangled, so the bound method held by LazyChangePoints can be pickled
+        change_points, weak_change_points = self.__compute_change_points(self.__series, self.options, metrics)
+        # Don't overwrite change points that were passed to the constructor
+        pending = set(self.change_points.pending())
+        pending_weak = set(self.weak_change_points.pending())
+        for metric in change_points.keys():
+            if metric in pending:
+                self.change_points[metric] = change_points[metric]
+            if metric in pending_weak:
+                self.weak_change_points[metric] = weak_change_points[metric]
 
     @staticmethod
     def __compute_change_points(
-        series: Series, options: AnalysisOptions
-    ) -> Dict[str, List[ChangePoint]]:
+        series: Series, options: AnalysisOptions, metrics: List[str]
+    ) -> (Dict[str, List[ChangePoint]], Dict[str, List[ChangePoint]]):
+        if options.multivariate:
+            # The metrics are analyzed jointly, so all of them are computed at once
+            metrics = list(series.data.keys())
         result = {}
         weak_change_points = {}
-        for metric in series.data.keys():
+        for metric in metrics:
             result[metric] = []
             weak_change_points[metric] = []
-            values = series.data[metric].copy()
-            fill_missing(values)
-            if options.orig_edivisive:
-                change_points, _ = compute_change_points_orig(
-                    values,
-                    max_pvalue=options.max_pvalue,
-                )
-                result[metric] = change_points
-            else:
-                change_points, weak_cps = compute_change_points(
-                    values,
-                    window_len=options.window_len,
-                    max_pvalue=options.max_pvalue,
-                    min_magnitude=options.min_magnitude,
-                )
-                for c in weak_cps:
-                    weak_change_points[metric].append(
-                        ChangePoint(
-                            index=c.index, qhat=0.0, time=series.time[c.index], metric=metric, stats=c.stats
-                        )
-                    )
+        rows = {metric: row for row, metric in enumerate(series.data.keys())}
+        filled_values = series.values[[rows[metric] for metric in metrics]]
+        fill_missing(filled_values)
+        values = dict(zip(metrics, filled_values))
+
+        if options.multivariate:
+            # One joint pass over all metrics; every metric gets its own stats at the joint change points
+            _, all_change_points = compute_change_points_multivariate(
+                filled_values,
+                max_pvalue=options.max_pvalue,
+                workers=options.permutation_workers,
+                fitted_null=options.fitted_null,
+                min_magnitude=options.min_magnitude,
+            )
+            for metric, change_points in zip(values.keys(), all_change_points):
                 for c in change_points:
                     result[metric].append(
                         ChangePoint(
-                            index=c.index, qhat=0.0, time=series.time[c.index], metric=metric, stats=c.stats
+                            index=c.index, qhat=c.qhat, time=series.time[c.index].item(), metric=metric, stats=c.stats
                         )
                     )
+            return result, weak_change_points
+
+        if options.orig_edivisive:
+            all_change_points = _run_jobs(
+                [
+                    partial(
+                        compute_change_points_orig,
+                        metric_values,
+                        max_pvalue=options.max_pvalue,
+                        calculator=CALCULATORS[options.calculator],
+                        workers=options.permutation_workers,
+                        fitted_null=options.fitted_null,
+                    )
+                    for metric_values in values.values()
+                ],
+                options,
+            )
+            for metric, (change_points, _) in zip(values.keys(), all_change_points):
+                result[metric] = change_points
+            return result, weak_change_points
+
+        if options.calculator == "pair_distance" and not options.fixed_stride_split:
+            # All metrics share the time axis, so their windows can be analyzed together;
+            # with jobs, each job analyzes a group of metrics
+            groups = np.array_split(filled_values, max(1, min(options.jobs or 1, len(filled_values))))
+            analyzed_groups = _run_jobs(
+                [
+                    partial(
+                        compute_change_points_batch,
+                        group,
+                        window_len=options.window_len,
+                        max_pvalue=options.max_pvalue,
+                        min_magnitude=options.min_magnitude,
+                    )
+                    for group in groups
+                ],
+                options,
+            )
+            all_change_points = [change_points for group in analyzed_groups for change_points in group]
+        else:
+            all_change_points = _run_jobs(
+                [
+                    partial(
+                        compute_change_points,
+                        metric_values,
+                        window_len=options.window_len,
+                        max_pvalue=options.max_pvalue,
+                        min_magnitude=options.min_magnitude,
+                        calculator=CALCULATORS[options.calculator],
+                        fixed_stride=options.fixed_stride_split,
+                        workers=options.split_workers,
+                    )
+                    for metric_values in values.values()
+                ],
+                options,
+            )
+
+        for metric, (change_points, weak_cps) in zip(values.keys(), all_change_points):
+            for c in weak_cps:
+                weak_change_points[metric].append(
+                    ChangePoint(
+                        index=c.index, qhat=0.0, time=series.time[c.index].item(), metric=metric, stats=c.stats
+                    )
+                )
+            for c in change_points:
+                result[metric].append(
+                    ChangePoint(
+                        index=c.index, qhat=0.0, time=series.time[c.index].item(), metric=metric, stats=c.stats
+                    )
+                )
         # If you got an exception and are wondering about the next row...
         # weak_cps is an optimization which you can ignore
         return result, weak_change_points
@@ -277,16 +731,16 @@ class AnalyzedSeries:
         series: Series, change_points: Dict[str, List[ChangePoint]]
     ) -> List[ChangePointGroup]:
         changes: List[ChangePoint] = []
-        for metric in change_points.keys():
-            changes += change_points[metric]
+        for metric_change_points in change_points.values():
+            changes += metric_change_points
 
         changes.sort(key=lambda c: c.index)
         points = []
         for k, g in groupby(changes, key=lambda c: c.index):
             cp = ChangePointGroup(
                 index=k,
-                time=series.time[k],
-                prev_time=series.time[k - 1],
+                time=series.time[k].item(),
+                prev_time=series.time[k - 1].item(),
                 attributes=series.attributes_at(k),
                 prev_attributes=series.attributes_at(k - 1),
                 changes=list(g),
@@ -334,7 +788,7 @@ class AnalyzedSeries:
         if not isinstance(attributes, dict):
             return ValueError("attributes must be a dict.")
 
-        max_time = max(self.__series.time)
+        max_time = self.__series.time.max()
         for t in time:
             if t <= max_time:
                 return ValueError("time must be monotonously increasing if you use append() time={}".format(time))
@@ -354,45 +808,55 @@ class AnalyzedSeries:
         if err is not None:
             raise err
 
-        for t in time:
-            self.__series.time.append(t)
-        for m in self.__series.metrics.keys():
-            if m in new_data.keys():
-                self.__series.data[m] += new_data[m]
-        for k, v in attributes.items():
-            self.__series.attributes[k].append(v)
+        # Appending updates the change points computed so far
+        self.compute()
+        self.__series.extend(time, new_data, attributes)
+        filled_values = self.__series.values.copy()
+        fill_missing(filled_values)
 
         result = {}
         weak_change_points = {}
 
+        metrics = [metric for metric in self.__series.data.keys() if metric in new_data]
         for metric in self.__series.data.keys():
             if metric not in new_data:
                 weak_change_points[metric] = self.weak_change_points[metric]
-                continue
-
-            change_points, weak_cps = compute_change_points(
-                self.__series.data[metric],
-                window_len=self.options.window_len,
-                max_pvalue=self.options.max_pvalue,
-                min_magnitude=self.options.min_magnitude,
-                new_data=len(new_data[metric]),
-                old_weak_cp=self.weak_change_points.get(metric, [])
-            )
+
+        all_change_points = _run_jobs(
+            [
+                partial(
+                    compute_change_points,
+                    metric_values,
+                    window_len=self.options.window_len,
+                    max_pvalue=self.options.max_pvalue,
+                    min_magnitude=self.options.min_magnitude,
+                    new_data=len(new_data[metric]),
+                    old_weak_cp=self.weak_change_points.get(metric, []),
+                    calculator=CALCULATORS[self.options.calculator],
+                    fixed_stride=self.options.fixed_stride_split,
+                    # Only a few windows at the tail are analyzed, not worth starting worker processes
+                    workers=None,
+                )
+                for metric, metric_values in zip(self.__series.data.keys(), filled_values)
+                if metric in new_data
+            ],
+            self.options,
+        )
+        for metric, (change_points, weak_cps) in zip(metrics, all_change_points):
             result[metric] = []
             for c in change_points:
                 result[metric].append(
                     ChangePoint(
-                        index=c.index, qhat=0.0, time=self.__series.time[c.index], metric=metric, stats=c.stats
+                        index=c.index, qhat=0.0, time=self.__series.time[c.index].item(), metric=metric, stats=c.stats
                     )
                 )
             weak_change_points[metric] = []
             for c in weak_cps:
                 weak_change_points[metric].append(
                     ChangePoint(
-                        index=c.index, qhat=0.0, time=self.__series.time[c.index], metric=metric, stats=c.stats
+                        index=c.index, qhat=0.0, time=self.__series.time[c.index].item(), metric=metric, stats=c.stats
                     )
                 )
-            fill_missing(self.__series.data[metric])
 
         # If some metrics didn't participate in this round, we still keep them, but update the ones
         # We did recompute
@@ -400,7 +864,7 @@ class AnalyzedSeries:
             self.change_points[metric] = result[metric]
         for metric in weak_change_points.keys():
             self.weak_change_points[metric] = weak_change_points[metric]
-        self.change_points_by_time = self.__group_change_points_by_time(self.__series, self.change_points)
+        self.__change_points_by_time = None
         return result, weak_change_points
 
     def test_name(self) -> str:
@@ -412,11 +876,11 @@ class AnalyzedSeries:
     def len(self) -> int:
         return len(self.__series.time)
 
-    def time(self) -> List[int]:
-        return [int(t) for t in self.__series.time]
+    def time(self) -> np.ndarray:
+        return self.__series.time
 
-    def data(self, metric: str) -> List[float]:
-        return [float(d) for d in self.__series.data[metric]]
+    def data(self, metric: str) -> np.ndarray:
+        return self.__series.data[metric]
 
     def attributes(self) -> Iterable[str]:
         return self.__series.attributes.keys()
@@ -424,7 +888,7 @@ class AnalyzedSeries:
     def attributes_at(self, index: int) -> Dict[str, str]:
         return self.__series.attributes_at(index)
 
-    def attribute_values(self, attribute: str) -> List[str]:
+    def attribute_values(self, attribute: str) -> AttributeColumn:
         return self.__series.attributes[attribute]
 
     def metric_names(self) -> Iterable[str]:
@@ -433,6 +897,9 @@ class AnalyzedSeries:
     def metric(self, name: str) -> Metric:
         return self.__series.metrics[name]
 
+    def series(self) -> Series:
+        return self.__series
+
     def to_json(self):
         change_points_json = {}
         for metric, cps in self.change_points.items():
@@ -444,17 +911,17 @@ class AnalyzedSeries:
 
         data_json = {}
         for metric, datapoints in self.__series.data.items():
-            data_json[metric] = [float(d) if d is not None else None for d in datapoints]
+            data_json[metric] = [None if np.isnan(d) else d for d in datapoints.tolist()]
 
         return {
             "test_name": self.test_name(),
-            "time": self.time(),
-            "change_points_timestamp": self.change_points_timestamp,
+            "time": self.time().tolist(),
+            "change_points_timestamp": self.change_points_timestamp.isoformat(),
             "branch_name": self.branch_name(),
             "options": self.options.to_json(),
-            "metrics": self.__series.metrics,
-            "attributes": self.__series.attributes,
-            "data": self.__series.data,
+            "metrics": {name: metric.to_json() for name, metric in self.__series.metrics.items()},
+            "attributes": {name: values.tolist() for name, values in self.__series.attributes.items()},
+            "data": data_json,
             "change_points": change_points_json,
             "weak_change_points": weak_change_points_json
         }
@@ -463,8 +930,11 @@ class AnalyzedSeries:
     def from_json(cls, analyzed_json):
         new_metrics = {}
 
-        for metric_name, unit in analyzed_json["metrics"].items():
-            new_metrics[metric_name] = Metric(None, None, unit)
+        for metric_name, metric in analyzed_json["metrics"].items():
+            if isinstance(metric, dict):
+                new_metrics[metric_name] = Metric(metric["direction"], metric["scale"], metric["unit"])
+            else:
+                new_metrics[metric_name] = Metric(None, None, metric)
 
         new_series = Series(
             analyzed_json["test_name"],
@@ -475,11 +945,7 @@ class AnalyzedSeries:
             analyzed_json["attributes"]
         )
 
-        new_options = AnalysisOptions()
-        new_options.window_len = analyzed_json["options"]["window_len"]
-        new_options.max_pvalue = analyzed_json["options"]["max_pvalue"]
-        new_options.min_magnitude = analyzed_json["options"]["min_magnitude"]
-        new_options.orig_edivisive = analyzed_json["options"]["orig_edivisive"]
+        new_options = AnalysisOptions.from_json(analyzed_json["options"])
 
         new_change_points = {}
         for metric, change_points in analyzed_json["change_points"].items():
@@ -494,7 +960,7 @@ class AnalyzedSeries:
                 )
                 new_list.append(
                     ChangePoint(
-                        index=cp["index"], time=cp["time"], metric=cp["metric"], stats=stat
+                        index=cp["index"], qhat=0.0, time=cp["time"], metric=cp["metric"], stats=stat
                     )
                 )
             new_change_points[metric] = new_list
@@ -512,16 +978,17 @@ class AnalyzedSeries:
                 )
                 new_list.append(
                     ChangePoint(
-                        index=cp["index"], time=cp["time"], metric=cp["metric"], stats=stat
+                        index=cp["index"], qhat=0.0, time=cp["time"], metric=cp["metric"], stats=stat
                     )
                 )
             new_weak_change_points[metric] = new_list
 
-        analyzed_series = cls(new_series, new_options, new_change_points)
-        analyzed_series.weak_change_points = new_weak_change_points
+        analyzed_series = cls(new_series, new_options, new_change_points, new_weak_change_points)
 
         if "change_points_timestamp" in analyzed_json.keys():
-            analyzed_series.change_points_timestamp = analyzed_json["change_points_timestamp"]
-            analyzed_series.change_points_by_time = AnalyzedSeries.__group_change_points_by_time(analyzed_series.__series, analyzed_series.change_points)
+            timestamp = analyzed_json["change_points_timestamp"]
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+            analyzed_series.change_points_timestamp = timestamp
 
         return analyzed_series
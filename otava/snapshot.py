@@ -0,0 +1,236 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Binary snapshots of analyzed series.
+
+A snapshot holds the same information as `AnalyzedSeries.to_json`, but the data points and change points
+are stored as contiguous little-endian arrays, so they can be loaded without parsing, or even mapped
+into memory. The layout is:
+
+    magic (8 bytes) | header length (uint64) | header (JSON) | padding | arrays
+
+The header holds the options and metadata of the series, the categories of the attributes, and the
+dtype, shape and offset of every array. Arrays start at multiples of 64 bytes from the start of the
+arrays section:
+
+    time                       int64[n]      times of the data points, float64[n] if some are fractional
+    values                     float64[m, n] values of the metrics, a row per metric, NaN if missing
+    attributes/<name>          int32[n]      codes of the attribute values, see `AttributeColumn`
+    <kind>/counts              int64[m]      number of change points of each metric
+    <kind>/index               int64[k]      indexes of the change points, grouped by metric
+    <kind>/time                int64[k]      times of the change points, the same dtype as `time`
+    <kind>/stats               float64[k, 5] mean_1, mean_2, std_1, std_2 and pvalue of the change points
+
+where kind is `change_points` or `weak_change_points`.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, List
+
+import numpy as np
+
+from otava.analysis import TTestStats
+from otava.series import (
+    AnalysisOptions,
+    AnalyzedSeries,
+    AttributeColumn,
+    ChangePoint,
+    Metric,
+    Series,
+)
+
+MAGIC = b"OTAVASNP"
+VERSION = 1
+
+_PREFIX = struct.Struct("<8sQ")
+_ALIGNMENT = 64
+_STATS = ("mean_1", "mean_2", "std_1", "std_2", "pvalue")
+
+
+@dataclass
+class SnapshotError(Exception):
+    message: str
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _change_point_arrays(
+    kind: str, metrics: List[str], change_points: Dict[str, List[ChangePoint]], time_dtype: str
+) -> Dict[str, np.ndarray]:
+    all_change_points = [cp for metric in metrics for cp in change_points.get(metric, [])]
+    return {
+        f"{kind}/counts": np.array([len(change_points.get(metric, [])) for metric in metrics], dtype="<i8"),
+        f"{kind}/index": np.array([cp.index for cp in all_change_points], dtype="<i8"),
+        f"{kind}/time": np.array([cp.time for cp in all_change_points], dtype=time_dtype),
+        f"{kind}/stats": np.array(
+            [[getattr(cp.stats, stat) for stat in _STATS] for cp in all_change_points], dtype="<f8"
+        ).reshape(-1, len(_STATS)),
+    }
+
+
+def _change_points(kind: str, metrics: List[str], arrays: Dict[str, np.ndarray]) -> Dict[str, List[ChangePoint]]:
+    indexes = arrays[f"{kind}/index"].tolist()
+    times = arrays[f"{kind}/time"].tolist()
+    stats = arrays[f"{kind}/stats"].tolist()
+    result = {}
+    start = 0
+    for metric, count in zip(metrics, arrays[f"{kind}/counts"].tolist()):
+        result[metric] = [
+            ChangePoint(
+                index=indexes[i],
+                qhat=0.0,
+                time=times[i],
+                metric=metric,
+                stats=TTestStats(**dict(zip(_STATS, stats[i]))),
+            )
+            for i in range(start, start + count)
+        ]
+        start += count
+    return result
+
+
+def write_snapshot(analyzed_series: AnalyzedSeries, file: BinaryIO):
+    """Writes a snapshot of the series and all its change points to a binary file."""
+    series = analyzed_series.series()
+    metrics = list(series.data.keys())
+    time_dtype = "<f8" if series.time.dtype.kind == "f" else "<i8"
+    arrays = {
+        "time": series.time.astype(time_dtype, copy=False),
+        "values": series.values.astype("<f8", copy=False),
+    }
+    for name, column in series.attributes.items():
+        arrays[f"attributes/{name}"] = column.codes.astype("<i4", copy=False)
+    # Iterating over the items computes the pending change points in one go
+    arrays.update(
+        _change_point_arrays("change_points", metrics, dict(analyzed_series.change_points.items()), time_dtype)
+    )
+    arrays.update(
+        _change_point_arrays(
+            "weak_change_points", metrics, dict(analyzed_series.weak_change_points.items()), time_dtype
+        )
+    )
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps(
+        {
+            "version": VERSION,
+            "test_name": analyzed_series.test_name(),
+            "branch_name": analyzed_series.branch_name(),
+            "change_points_timestamp": analyzed_series.change_points_timestamp.isoformat(),
+            "options": analyzed_series.options.to_json(),
+            "metrics": {name: metric.to_json() for name, metric in series.metrics.items()},
+            "rows": metrics,
+            "attributes": {name: column.categories for name, column in series.attributes.items()},
+            "arrays": layout,
+        }
+    ).encode("utf-8")
+
+    file.write(_PREFIX.pack(MAGIC, len(header)))
+    file.write(header)
+    position = _PREFIX.size + len(header)
+    start = _align(position)
+    for name, array in arrays.items():
+        array_start = start + layout[name]["offset"]
+        file.write(b"\0" * (array_start - position))
+        file.write(np.ascontiguousarray(array).data)
+        position = array_start + array.nbytes
+
+
+def save_snapshot(analyzed_series: AnalyzedSeries, path: Path):
+    """
+    Writes a snapshot of the series to a file atomically, so that readers, possibly in other processes,
+    see either the previous file or the complete new one, and an interrupted write leaves nothing behind.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write_snapshot(analyzed_series, file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path: str, memory_map: bool = True) -> AnalyzedSeries:
+    """
+    Reads the analyzed series from a snapshot file. With `memory_map`, the arrays of the series are
+    read-only views of the memory-mapped file, so only the accessed parts of the file are read.
+    Otherwise, the file is read at once.
+    """
+    try:
+        with open(path, "rb") as file:
+            if memory_map:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = file.read()
+        magic, header_len = _PREFIX.unpack_from(buffer)
+        if magic != MAGIC:
+            raise SnapshotError(f"Not a snapshot file: {path}")
+        header = json.loads(bytes(buffer[_PREFIX.size : _PREFIX.size + header_len]))
+        if header["version"] != VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {header['version']}: {path}")
+        start = _align(_PREFIX.size + header_len)
+        arrays = {
+            name: np.frombuffer(
+                buffer,
+                dtype=np.dtype(spec["dtype"]),
+                count=int(np.prod(spec["shape"])),
+                offset=start + spec["offset"],
+            ).reshape(spec["shape"])
+            for name, spec in header["arrays"].items()
+        }
+    except (ValueError, KeyError, TypeError, struct.error) as err:
+        raise SnapshotError(f"Invalid snapshot file {path}: {err}")
+
+    metrics = header["rows"]
+    series = Series.from_arrays(
+        header["test_name"],
+        header["branch_name"],
+        arrays["time"],
+        {
+            name: Metric(metric["direction"], metric["scale"], metric["unit"])
+            for name, metric in header["metrics"].items()
+        },
+        metrics,
+        arrays["values"],
+        {
+            name: AttributeColumn.from_codes(categories, arrays[f"attributes/{name}"])
+            for name, categories in header["attributes"].items()
+        },
+    )
+    analyzed_series = AnalyzedSeries(
+        series,
+        AnalysisOptions.from_json(header["options"]),
+        _change_points("change_points", metrics, arrays),
+        _change_points("weak_change_points", metrics, arrays),
+    )
+    analyzed_series.change_points_timestamp = datetime.fromisoformat(header["change_points_timestamp"])
+    return analyzed_series
@@ -16,6 +16,8 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import numpy as np
+
 from otava.analysis import compute_change_points
 
 
@@ -105,3 +107,38 @@ def test_tb_incremental1(benchmark):
 
 def test_tb_incremental2(benchmark):
     benchmark(_actual_t_est, 0.2, new_data=1)
+
+
+def _get_long_series(length=20000, segment=200, seed=0):
+    """Noise around a level that shifts every `segment` points by a random amount."""
+    rng = np.random.default_rng(seed)
+    levels = np.repeat(rng.normal(0.0, 3.0, length // segment + 1), segment)[:length]
+    return rng.normal(100.0, 1.0, length) + levels
+
+
+def _fixed_stride_test(series, benchmark, workers=None):
+    expected, _ = compute_change_points(series, window_len=50, max_pvalue=0.001)
+    cps, _ = benchmark(
+        compute_change_points, series, window_len=50, max_pvalue=0.001, fixed_stride=True, workers=workers
+    )
+    # How closely the fixed stride mode matches the default one
+    expected = {cp.index for cp in expected}
+    found = {cp.index for cp in cps}
+    near = {index for index in found if {index - 1, index, index + 1} & expected}
+    benchmark.extra_info["default_change_points"] = len(expected)
+    benchmark.extra_info["change_points"] = len(found)
+    benchmark.extra_info["same_index"] = len(found & expected)
+    benchmark.extra_info["within_one_index"] = len(near)
+
+
+def test_long_default(benchmark):
+    series = _get_long_series()
+    benchmark(compute_change_points, series, window_len=50, max_pvalue=0.001)
+
+
+def test_long_fixed_stride(benchmark):
+    _fixed_stride_test(_get_long_series(), benchmark)
+
+
+def test_long_fixed_stride_workers4(benchmark):
+    _fixed_stride_test(_get_long_series(), benchmark, workers=4)
@@ -18,12 +18,19 @@
 import numpy as np
 
 from otava.analysis import (
+    CALCULATORS,
+    IntervalMoments,
     TTestSignificanceTester,
     compute_change_points,
+    compute_change_points_batch,
+    compute_change_points_multivariate,
     compute_change_points_orig,
     fill_missing,
+    merge,
+    split,
 )
 from otava.change_point_divisive.base import CandidateChangePoint
+from otava.change_point_divisive.calculator import BlockedPairDistanceCalculator
 
 
 def test_fill_missing():
@@ -38,6 +45,22 @@ def test_fill_missing():
     assert list3 == [1.0, 1.2, 0.5, 0.5, 0.5]
 
 
+def test_fill_missing_array():
+    data = np.array([
+        [np.nan, np.nan, 1.0, 1.2, 0.5],
+        [1.0, 1.2, np.nan, np.nan, 4.3],
+        [1.0, 1.2, 0.5, np.nan, np.nan],
+        [np.nan] * 5,
+    ])
+    fill_missing(data)
+    assert data[:3].tolist() == [
+        [1.0, 1.0, 1.0, 1.2, 0.5],
+        [1.0, 1.2, 1.2, 1.2, 4.3],
+        [1.0, 1.2, 0.5, 0.5, 0.5],
+    ]
+    assert np.isnan(data[3]).all()
+
+
 def test_single_series():
     series = [
         1.02,
@@ -93,6 +116,73 @@ def test_single_series_original():
     indexes = [c.index for c in cps]
     assert indexes == [10]
 
+    cps, _ = compute_change_points_orig(series, max_pvalue=0.0001, seed=1, calculator=BlockedPairDistanceCalculator)
+    indexes = [c.index for c in cps]
+    assert indexes == [10]
+
+    cps, _ = compute_change_points_orig(series, max_pvalue=0.0001, seed=1, fitted_null=True)
+    indexes = [c.index for c in cps]
+    assert indexes == [10]
+
+
+def test_fitted_null_constant_series():
+    cps, _ = compute_change_points_orig([1.0] * 20, fitted_null=True)
+    assert cps == []
+    cps, _ = compute_change_points_orig([1.0] * 10 + [2.0] * 10, fitted_null=True)
+    assert [c.index for c in cps] == [10]
+
+
+def test_multivariate_series():
+    rng = np.random.default_rng(1)
+    shift = np.repeat([0.0, 2.0], 100)
+    # Correlated series on different scales, and one series without a change
+    data = [rng.normal(0.0, 1.0, 200) + shift, 100 * (rng.normal(0.0, 1.0, 200) + shift), rng.normal(0.0, 1.0, 200)]
+    cps, series_cps = compute_change_points_multivariate(data, max_pvalue=0.01, seed=1)
+    assert [c.index for c in cps] == [100]
+    assert len(series_cps) == len(data)
+    for series, change_points in zip(data[:2], series_cps[:2]):
+        assert [c.index for c in change_points] == [100]
+        assert np.isclose(change_points[0].stats.mean_1, np.mean(series[:100]))
+        assert np.isclose(change_points[0].stats.mean_2, np.mean(series[100:]))
+        assert change_points[0].stats.pvalue < 0.01
+    # The series without a change doesn't get the joint change point
+    assert series_cps[2] == []
+
+    # A large min_magnitude filters out the change points of all series
+    _, series_cps = compute_change_points_multivariate(data, max_pvalue=0.01, seed=1, min_magnitude=1000.0)
+    assert series_cps == [[], [], []]
+
+
+def test_multivariate_missing_series():
+    rng = np.random.default_rng(1)
+    shift = np.repeat([0.0, 2.0], 100)
+    data = [rng.normal(0.0, 1.0, 200) + shift, np.full(200, np.nan), 10 * (rng.normal(0.0, 1.0, 200) + shift)]
+    cps, series_cps = compute_change_points_multivariate(data, max_pvalue=0.01, seed=1)
+    assert [c.index for c in cps] == [100]
+    assert [[c.index for c in change_points] for change_points in series_cps] == [[100], [], [100]]
+
+    cps, series_cps = compute_change_points_multivariate([np.full(50, np.nan)], max_pvalue=0.01, seed=1)
+    assert cps == [] and series_cps == [[]]
+
+
+def test_compute_change_points_batch():
+    rng = np.random.default_rng(3)
+    data = rng.normal(0.0, 1.0, size=(6, 300))
+    data[1, 120:] += 3.0
+    data[2, 40:] += 1.5
+    data[2, 210:] -= 4.0
+    data[3, 150:] *= 3.0
+    data[4] = 1.0
+    for window_len, max_pvalue in [(10, 0.01), (30, 0.001), (50, 0.05)]:
+        batch = compute_change_points_batch(data, window_len=window_len, max_pvalue=max_pvalue)
+        assert len(batch) == len(data)
+        for series, (cps, weak_cps) in zip(data, batch):
+            expected_cps, expected_weak_cps = compute_change_points(
+                series, window_len=window_len, max_pvalue=max_pvalue
+            )
+            assert [(c.index, c.stats) for c in cps] == [(c.index, c.stats) for c in expected_cps]
+            assert [(c.index, c.stats) for c in weak_cps] == [(c.index, c.stats) for c in expected_weak_cps]
+
 
 def test_significance_tester():
     tester = TTestSignificanceTester(0.001)
@@ -108,3 +198,87 @@ def test_significance_tester():
     cp = tester.change_point(candidate, series, intervals=[slice(None, None)])
     assert tester.is_significant(cp)
     assert 0.00 < cp.stats.pvalue < 0.001
+
+
+def test_interval_moments():
+    rng = np.random.default_rng(0)
+    series = np.concatenate([rng.normal(1000.0, 1.0, 50), np.full(20, 3.7), rng.normal(0.0, 5.0, 30)])
+    moments = IntervalMoments(series)
+    starts = np.array([0, 10, 50, 55, 60, 99, 0])
+    stops = np.array([100, 40, 70, 58, 90, 100, 1])
+    means, stds = moments.moments(starts, stops)
+    for start, stop, mean, std in zip(starts, stops, means, stds):
+        assert np.isclose(mean, np.mean(series[start:stop]))
+        assert np.isclose(std, np.std(series[start:stop]))
+    # constant intervals are computed directly rather than from the cumulative sums
+    assert (means[3], stds[3]) == (np.mean(series[55:58]), np.std(series[55:58]))
+    assert stds[3] < 1e-12
+
+
+def test_significance_tester_change_points():
+    tester = TTestSignificanceTester(0.001)
+    rng = np.random.default_rng(1)
+    series = rng.normal(0.0, 1.0, 100)
+    series[30:] += 2.0
+    series[60:80] = 5.0
+    indexes = [30, 60, 80]
+    candidates = [CandidateChangePoint(index=index, qhat=0.0) for index in indexes]
+    moments = IntervalMoments(series)
+    for intervals in [
+        [slice(None, 30), slice(30, 60), slice(60, 80), slice(80, None)],
+        [slice(None, 50), slice(50, 70), slice(70, None)],
+    ]:
+        cps = tester.change_points(candidates, moments, intervals)
+        for cp, candidate in zip(cps, candidates):
+            expected = tester.change_point(candidate, series, intervals)
+            assert cp.index == expected.index
+            for field in ["mean_1", "mean_2", "std_1", "std_2", "pvalue"]:
+                assert np.isclose(getattr(cp.stats, field), getattr(expected.stats, field))
+
+
+def test_merge():
+    def merge_by_scanning(change_points, series, max_pvalue, min_magnitude):
+        tester = TTestSignificanceTester(max_pvalue)
+        while change_points:
+            weakest_cp = max(change_points, key=lambda c: c.stats.pvalue)
+            if weakest_cp.stats.pvalue < max_pvalue:
+                weakest_cp = min(change_points, key=lambda c: c.stats.change_magnitude())
+                if weakest_cp.stats.change_magnitude() > min_magnitude:
+                    break
+            index = change_points.index(weakest_cp)
+            del change_points[index]
+            intervals = tester.get_intervals(change_points)
+            for i in range(index, min(index + 2, len(change_points))):
+                change_points[i] = tester.change_point(change_points[i].to_candidate(), series, intervals)
+        return change_points
+
+    rng = np.random.default_rng(2)
+    series = rng.normal(10.0, 1.0, 1000) + np.repeat(rng.normal(0.0, 1.0, 20), 50)
+    weak_change_points = split(series, window_len=30, max_pvalue=0.3)
+    assert len(weak_change_points) > 50
+    for max_pvalue, min_magnitude in [(0.001, 0.0), (0.01, 0.05)]:
+        change_points = weak_change_points[:]
+        expected = merge_by_scanning(weak_change_points[:], series, max_pvalue, min_magnitude)
+        assert merge(change_points, series, max_pvalue, min_magnitude) is change_points
+        assert [c.index for c in change_points] == [c.index for c in expected]
+        for cp, expected_cp in zip(change_points, expected):
+            assert np.isclose(cp.stats.pvalue, expected_cp.stats.pvalue)
+
+
+def test_fixed_stride_split():
+    rng = np.random.default_rng(4)
+    series = rng.normal(0.0, 1.0, 600)
+    series[200:] += 5.0
+    series[410:] -= 5.0
+    change_points, _ = compute_change_points(series, window_len=50, max_pvalue=0.001, fixed_stride=True)
+    assert [c.index for c in change_points] == [200, 410]
+    weak_change_points = split(series, window_len=50, max_pvalue=0.01, fixed_stride=True)
+    parallel = split(series, window_len=50, max_pvalue=0.01, fixed_stride=True, workers=3)
+    assert [(c.index, c.stats) for c in parallel] == [(c.index, c.stats) for c in weak_change_points]
+
+
+def test_all_missing_series():
+    series = np.full(60, np.nan)
+    for calculator in CALCULATORS.values():
+        assert compute_change_points(series, window_len=30, calculator=calculator) == ([], [])
+        assert compute_change_points(series, window_len=30, calculator=calculator, fixed_stride=True) == ([], [])
@@ -0,0 +1,131 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import os
+import tempfile
+
+import numpy as np
+
+from otava.cache import AnalysisCache
+from otava.series import AnalysisOptions, Metric, Series
+
+
+def _series(seed: int = 0, length: int = 120) -> Series:
+    rng = np.random.default_rng(seed)
+    values = rng.normal(10.0, 0.5, length)
+    values[length // 2:] += 3.0
+    return Series(
+        "test",
+        branch=None,
+        time=list(range(1000, 1000 + length)),
+        metrics={"m1": Metric(1, 1.0, "ms")},
+        data={"m1": [None if i == 5 else float(v) for i, v in enumerate(values)]},
+        attributes={"commit": [f"c{i}" for i in range(length)]},
+    )
+
+
+def test_cache_hit(monkeypatch):
+    options = AnalysisOptions()
+    options.window_len = 30
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AnalysisCache(directory)
+        analyzed_series = cache.analyze(_series(), options)
+        assert len(os.listdir(directory)) == 1
+
+        def analyze(self, options):
+            raise AssertionError("The cached result should be used")
+
+        monkeypatch.setattr(Series, "analyze", analyze)
+        series = _series()
+        series.metrics["m1"] = Metric(-1, 1.0, "ms")
+        cached = cache.analyze(series, options)
+
+    assert cached.change_points == analyzed_series.change_points
+    assert cached.weak_change_points == analyzed_series.weak_change_points
+    assert [g.index for g in cached.change_points_by_time] == [60]
+    assert cached.series() is series
+    assert cached.metric("m1").direction == -1
+
+
+def test_cache_key():
+    options = AnalysisOptions()
+    key = AnalysisCache.key(_series(), options)
+    assert AnalysisCache.key(_series(), options) == key
+    assert AnalysisCache.key(_series(seed=1), options) != key
+    assert AnalysisCache.key(_series(length=121), options) != key
+
+    other_options = AnalysisOptions()
+    other_options.window_len = 20
+    assert AnalysisCache.key(_series(), other_options) != key
+    other_options = AnalysisOptions()
+    other_options.jobs = 4
+    other_options.split_workers = 2
+    assert AnalysisCache.key(_series(), other_options) == key
+
+    # Fractional times are not truncated
+    series = _series()
+    series.time = series.time + 0.5
+    assert AnalysisCache.key(series, options) != key
+
+    # Attributes and metric properties don't change the change points
+    series = _series()
+    series.metrics["m1"] = Metric(-1, 2.0, "s")
+    series.attributes = {}
+    assert AnalysisCache.key(series, options) == key
+
+
+def test_eviction():
+    options = AnalysisOptions()
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AnalysisCache(directory)
+        keys = []
+        for seed in range(3):
+            series = _series(seed)
+            cache.analyze(series, options)
+            keys.append(AnalysisCache.key(series, options))
+            os.utime(cache.path(keys[-1]), (1000 + seed, 1000 + seed))
+
+        # Using the oldest entry makes it the most recently used one
+        cache.analyze(_series(0), options)
+        cache.max_size = os.path.getsize(cache.path(keys[0])) + os.path.getsize(cache.path(keys[2]))
+        cache.evict()
+        assert [cache.path(key).exists() for key in keys] == [True, False, True]
+
+
+def test_unreadable_entry():
+    options = AnalysisOptions()
+    options.window_len = 30
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AnalysisCache(directory)
+        series = _series()
+        cache.path(AnalysisCache.key(series, options)).write_bytes(b"garbage")
+        analyzed_series = cache.analyze(series, options)
+        assert [g.index for g in analyzed_series.change_points_by_time] == [60]
+        # The entry was replaced by a valid one
+        assert cache.load(AnalysisCache.key(series, options), series, options) is not None
+
+
+def test_unsupported_options():
+    options = AnalysisOptions()
+    options.orig_edivisive = True
+    options.fitted_null = True
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AnalysisCache(directory)
+        analyzed_series = cache.analyze(_series(), options)
+        # The fitted null distribution is random, so only the strongest change point is certain
+        assert 60 in [g.index for g in analyzed_series.change_points_by_time]
+        assert os.listdir(directory) == []
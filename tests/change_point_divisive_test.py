@@ -19,10 +19,19 @@ import numpy as np
 import pytest
 
 from otava.analysis import TTestSignificanceTester, TTestStats
-from otava.change_point_divisive.base import ChangePoint
-from otava.change_point_divisive.calculator import PairDistanceCalculator
+from otava.change_point_divisive import significance_test
+from otava.change_point_divisive.base import CandidateChangePoint, ChangePoint
+from otava.change_point_divisive.calculator import (
+    BlockedPairDistanceCalculator,
+    MultivariatePairDistanceCalculator,
+    PairDistanceCalculator,
+    SlidingWindowDistances,
+)
 from otava.change_point_divisive.detector import ChangePointDetector
-from otava.change_point_divisive.significance_test import PermutationsSignificanceTester
+from otava.change_point_divisive.significance_test import (
+    FittedNullSignificanceTester,
+    PermutationsSignificanceTester,
+)
 
 SEQUENCE = np.array([
     0.3, 2.4, 1.5, -0.9, -0.5,
@@ -82,6 +91,75 @@ def test_calculator_candidate():
     assert test_candidate_ind == candidate.index
 
 
+def test_calculator_column_sums():
+    sequence = SEQUENCE.copy()
+    calc = PairDistanceCalculator(sequence)
+    for start, end in [(0, 5), (3, 11), (5, len(sequence)), (8, len(sequence))]:
+        Q = calc._get_Q_vals(start=start, end=end)
+        test_Q, _, _ = compute_Q_and_candidate_slow(sequence[start:end])
+        assert np.allclose(test_Q, Q)
+
+
+@pytest.mark.parametrize("block_elements", [1, 30, 2**17])
+def test_calculator_best_Q(monkeypatch, block_elements):
+    monkeypatch.setattr(PairDistanceCalculator, "_Q_BLOCK_ELEMENTS", block_elements)
+    sequence = SEQUENCE.copy()
+    for series in [sequence, np.round(sequence), np.ones_like(sequence)]:
+        calc = PairDistanceCalculator(series)
+        for start, end in [(0, 2), (0, 5), (3, 11), (5, len(series)), (0, len(series))]:
+            Q = calc._get_Q_vals(start=start, end=end)
+            i, j = np.unravel_index(np.argmax(Q), Q.shape)
+            assert calc._get_best_Q(start=start, end=end) == (i, Q[i, j])
+
+
+@pytest.mark.parametrize("calculator", [PairDistanceCalculator, BlockedPairDistanceCalculator])
+def test_calculator_all_nan(monkeypatch, calculator):
+    # No pair `(τ, κ)` is better than another, the first one is picked like `np.argmax` does
+    monkeypatch.setattr(PairDistanceCalculator, "_Q_BLOCK_ELEMENTS", 30)
+    calc = calculator(np.full(20, np.nan))
+    for start, end in [(0, 2), (3, 11), (0, 20)]:
+        candidate = calc.get_candidate_change_point(slice(start, end))
+        assert candidate.index == start + 1
+        assert np.isnan(candidate.qhat)
+
+
+@pytest.mark.parametrize("power", [1., 0.5])
+def test_multivariate_calculator(power):
+    sequence = SEQUENCE.copy()
+    calc = MultivariatePairDistanceCalculator(sequence[:, None], power=power)
+    univariate_calc = PairDistanceCalculator(sequence, power=power)
+    for interval in [slice(None, None), slice(3, 11), slice(5, None)]:
+        assert calc.get_candidate_change_point(interval) == univariate_calc.get_candidate_change_point(interval)
+
+    series = np.stack([sequence, np.roll(sequence, 3) * 2], axis=1)
+    calc = MultivariatePairDistanceCalculator(series, power=power)
+    distances = np.power(np.linalg.norm(series[:, None, :] - series[None, :, :], axis=-1), power)
+    expected_calc = PairDistanceCalculator(series, power=power, distances=distances)
+    for interval in [slice(None, None), slice(3, 11), slice(5, None)]:
+        candidate = calc.get_candidate_change_point(interval)
+        expected = expected_calc.get_candidate_change_point(interval)
+        assert candidate.index == expected.index
+        assert np.isclose(candidate.qhat, expected.qhat)
+
+
+@pytest.mark.parametrize("power", [1., 0.5])
+def test_sliding_window_distances(power):
+    sequence = SEQUENCE.copy()
+    window_len = 6
+    distances = SlidingWindowDistances(sequence, window_len, power=power)
+    for start in range(len(sequence)):
+        for end in range(start + 1, min(start + window_len, len(sequence)) + 1):
+            window = sequence[start:end]
+            expected = np.power(np.abs(window[:, None] - window[None, :]), power)
+            assert np.array_equal(distances.window(start, end), expected)
+
+    window = distances.window(3, 9)
+    assert not window.flags.writeable
+    calc = PairDistanceCalculator(sequence[3:9], power=power, distances=window)
+    dense_calc = PairDistanceCalculator(sequence[3:9], power=power)
+    assert calc.get_candidate_change_point(slice(None, None)) == dense_calc.get_candidate_change_point(slice(None, None))
+
+
 def test_permutation_calculation():
     sequence = SEQUENCE.copy()
     calc = PairDistanceCalculator(sequence)
@@ -117,6 +195,27 @@ def test_ttest():
     assert [cp.index for cp in cps] == CHANGE_POINTS_INDS
 
 
+def test_candidates_are_memoized_by_interval():
+    class CountingCalculator(PairDistanceCalculator):
+        def __init__(self, series):
+            super().__init__(series)
+            self.intervals = []
+
+        def get_candidate_change_point(self, interval):
+            self.intervals.append(interval)
+            return super().get_candidate_change_point(interval)
+
+    sequence = SEQUENCE.copy()
+    st = TTestSignificanceTester(max_pvalue=0.01)
+    cpd = ChangePointDetector(significance_tester=st, calculator=CountingCalculator)
+    calc = CountingCalculator(sequence)
+    cpd.calculator = lambda series: calc
+    cps = cpd.get_change_points(series=sequence)
+    assert [cp.index for cp in cps] == CHANGE_POINTS_INDS
+    # Whole series, then two halves after each of the two splits
+    assert calc.intervals == [slice(0, None), slice(0, 5), slice(5, None), slice(5, 8), slice(8, None)]
+
+
 def test_get_intervals_requires_sorted_change_points():
     """Test that get_intervals() raises AssertionError when change points are not sorted by index."""
     tester = TTestSignificanceTester(max_pvalue=0.01)
@@ -143,3 +242,250 @@ def test_get_intervals_requires_sorted_change_points():
     ]
     with pytest.raises(AssertionError, match="Change points must be sorted by index"):
         tester.get_intervals(unsorted_cps)
+
+
+def test_calculator_append():
+    sequence = SEQUENCE.copy()
+    calc = PairDistanceCalculator(sequence[:4])
+    calc.get_candidate_change_point(slice(None, None))
+    calc.append(sequence[4:5])
+    calc.append(sequence[5:9])
+    calc.append(sequence[9:])
+
+    full_calc = PairDistanceCalculator(sequence)
+    full_calc._calculate_pairwise_differences()
+    assert np.allclose(calc.series, full_calc.series)
+    assert np.allclose(calc.distances, full_calc.distances)
+    assert np.allclose(calc.column_sums, full_calc.column_sums)
+    assert np.allclose(calc.V, full_calc.V)
+    assert np.allclose(calc.H, full_calc.H)
+
+    whole_interval = slice(None, None)
+    assert calc.get_candidate_change_point(whole_interval) == full_calc.get_candidate_change_point(whole_interval)
+
+
+@pytest.mark.parametrize("memory_budget", [1, 1024, 2**30])
+def test_blocked_calculator_candidate(memory_budget):
+    sequence = SEQUENCE.copy()
+    _, test_Q_max, test_candidate_ind = compute_Q_and_candidate_slow(sequence)
+
+    calc = BlockedPairDistanceCalculator(sequence, memory_budget=memory_budget)
+    candidate = calc.get_candidate_change_point(slice(None, None))
+    assert np.allclose(test_Q_max, candidate.qhat)
+    assert test_candidate_ind == candidate.index
+
+    dense_calc = PairDistanceCalculator(sequence)
+    for interval in [slice(0, 5), slice(3, 11), slice(5, None)]:
+        candidate = calc.get_candidate_change_point(interval)
+        dense_candidate = dense_calc.get_candidate_change_point(interval)
+        assert candidate.index == dense_candidate.index
+        assert np.allclose(candidate.qhat, dense_candidate.qhat)
+
+
+def test_blocked_calculator_float32():
+    sequence = SEQUENCE.copy()
+    calc = BlockedPairDistanceCalculator(sequence, dtype=np.float32, memory_budget=1024)
+    candidate = calc.get_candidate_change_point(slice(None, None))
+    dense_candidate = PairDistanceCalculator(sequence).get_candidate_change_point(slice(None, None))
+    assert candidate.index == dense_candidate.index
+    assert np.allclose(candidate.qhat, dense_candidate.qhat, rtol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "calculator", [PairDistanceCalculator, MultivariatePairDistanceCalculator, BlockedPairDistanceCalculator]
+)
+def test_permuted_qhats(calculator):
+    rng = np.random.default_rng(1)
+    sequence = SEQUENCE.copy()
+    series = sequence[:, None] if calculator is MultivariatePairDistanceCalculator else sequence
+    for intervals in [[slice(None, None)], [slice(0, 6), slice(6, 14), slice(14, None)], [slice(0, 1), slice(1, None)]]:
+        permutations = np.tile(np.arange(len(series)), (5, 1))
+        for permutation in permutations:
+            for interval in intervals:
+                rng.shuffle(permutation[interval])
+        qhats = calculator(series).get_permuted_qhats(permutations, intervals)
+        expected = [calculator(series[permutation]).get_next_candidate(intervals).qhat for permutation in permutations]
+        assert np.array_equal(qhats, expected)
+
+
+def test_permuted_qhats_keep_configuration():
+    # Permuted series are evaluated with the same parameters as the series itself
+    rng = np.random.default_rng(1)
+    permutations = np.array([rng.permutation(len(SEQUENCE)) for _ in range(3)])
+    calc = BlockedPairDistanceCalculator(SEQUENCE, power=0.5, memory_budget=1024, dtype=np.float32)
+    qhats = calc.get_permuted_qhats(permutations, [slice(None, None)])
+    expected = [
+        BlockedPairDistanceCalculator(SEQUENCE[permutation], power=0.5, memory_budget=1024, dtype=np.float32)
+        .get_next_candidate([slice(None, None)]).qhat
+        for permutation in permutations
+    ]
+    assert qhats == expected
+    default = [
+        BlockedPairDistanceCalculator(SEQUENCE[permutation]).get_next_candidate([slice(None, None)]).qhat
+        for permutation in permutations
+    ]
+    assert qhats != default
+
+
+def test_permutation_test_parallel():
+    sequence = SEQUENCE.copy()
+    results = []
+    for workers in [1, 3]:
+        st = PermutationsSignificanceTester(
+            max_pvalue=0.01, permutations=100, calculator=PairDistanceCalculator, seed=1, workers=workers
+        )
+        cpd = ChangePointDetector(significance_tester=st, calculator=PairDistanceCalculator)
+        try:
+            cps = cpd.get_change_points(series=sequence)
+        finally:
+            st.close()
+        assert [cp.index for cp in cps] == CHANGE_POINTS_INDS
+        results.append([cp.stats.permuted_qhats for cp in cps])
+    # Every permutation has its own random generator, so the number of workers does not matter
+    for qhats_1, qhats_3 in zip(*results):
+        assert np.array_equal(qhats_1, qhats_3)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_permutation_test_early_stop(workers):
+    sequence = SEQUENCE.copy()
+    calc = PairDistanceCalculator(sequence)
+    intervals = [slice(None, None)]
+    candidate = calc.get_next_candidate(intervals)
+    # The candidate at the beginning of the series is insignificant
+    weak_candidate = calc.get_candidate_change_point(slice(0, 10))
+    weak_candidate.index = 5
+    for max_pvalue in [0.001, 0.05, 0.5]:
+        full = PermutationsSignificanceTester(max_pvalue, 100, PairDistanceCalculator, seed=1, workers=workers)
+        early = PermutationsSignificanceTester(
+            max_pvalue, 100, PairDistanceCalculator, seed=1, workers=workers, early_stop=True
+        )
+        try:
+            for cand in [candidate, weak_candidate]:
+                full_point = full.change_point(cand, sequence, intervals)
+                early_point = early.change_point(cand, sequence, intervals)
+                assert full.is_significant(full_point) == early.is_significant(early_point)
+                assert early_point.stats.n_perm == len(early_point.stats.permuted_qhats)
+                if early.is_significant(early_point):
+                    assert early_point.stats.pvalue == full_point.stats.pvalue
+                    assert np.array_equal(early_point.stats.permuted_qhats, full_point.stats.permuted_qhats)
+                else:
+                    assert early_point.stats.n_perm < full_point.stats.n_perm
+        finally:
+            full.close()
+            early.close()
+
+
+def test_permutation_test_interval_cache(monkeypatch):
+    sequence = SEQUENCE.copy()
+    st = PermutationsSignificanceTester(0.01, 100, PairDistanceCalculator, seed=1, interval_cache=True)
+    cpd = ChangePointDetector(significance_tester=st, calculator=PairDistanceCalculator)
+    cps = cpd.get_change_points(series=sequence)
+    assert [cp.index for cp in cps] == CHANGE_POINTS_INDS
+
+    intervals = st.get_intervals(cps)
+    keys = [interval.indices(len(sequence))[:2] for interval in intervals]
+    assert set(st._interval_qhats) == {key for key in keys if key[1] - key[0] > 1}
+
+    # Nothing is permuted again for the intervals that are cached
+    calls = []
+    monkeypatch.setattr(significance_test, "_permuted_qhats", lambda *args: calls.append(args))
+    candidate = PairDistanceCalculator(sequence).get_next_candidate(intervals)
+    change_point = st.change_point(candidate, sequence, intervals)
+    assert calls == []
+    expected = np.max([st._interval_qhats[key] for key in st._interval_qhats], axis=0)
+    assert np.array_equal(change_point.stats.permuted_qhats, expected)
+    monkeypatch.undo()
+
+    # Early stopping and workers only change how many of the same permuted qhats are computed
+    for kwargs in [{"early_stop": True}, {"workers": 2}]:
+        other = PermutationsSignificanceTester(0.01, 100, PairDistanceCalculator, seed=1, interval_cache=True, **kwargs)
+        try:
+            other_point = other.change_point(candidate, sequence, intervals)
+        finally:
+            other.close()
+        qhats = other_point.stats.permuted_qhats
+        assert np.array_equal(qhats, change_point.stats.permuted_qhats[: len(qhats)])
+
+
+def test_fitted_null_tester(monkeypatch):
+    rng = np.random.default_rng(1)
+    series = np.concatenate([rng.normal(0.0, 1.0, 100), rng.normal(2.0, 1.0, 100)])
+    calc = PairDistanceCalculator(series)
+    intervals = [slice(None, None)]
+    candidate = calc.get_next_candidate(intervals)
+    st = FittedNullSignificanceTester(max_pvalue=0.01, calculator=PairDistanceCalculator, seed=1)
+    change_point = st.change_point(candidate, series, intervals)
+    assert candidate.index == 100
+    assert st.is_significant(change_point)
+    assert len(st._fitted) == 1
+
+    # Distributions are cached by interval length and normalized by scale, so scaled data needs no calibration
+    monkeypatch.setattr(st, "_calibrate", None)
+    scaled_point = st.change_point(PairDistanceCalculator(series * 10).get_next_candidate(intervals), series * 10, intervals)
+    assert np.isclose(scaled_point.stats.pvalue, change_point.stats.pvalue)
+    monkeypatch.undo()
+
+    # The same data in random order is not significant
+    rng.shuffle(series)
+    candidate = PairDistanceCalculator(series).get_next_candidate(intervals)
+    assert not st.is_significant(st.change_point(candidate, series, intervals))
+
+    # Qhat of two points is the same for all of their permutations
+    intervals = [slice(0, 198), slice(198, None)]
+    candidate = PairDistanceCalculator(series).get_candidate_change_point(intervals[1])
+    change_point = st.change_point(candidate, series, intervals)
+    assert change_point.stats.pvalue == 1.0
+
+
+def test_fitted_null_tester_matches_permutations():
+    # On series without a change, fitted p-values are within 0.1 from p-values of 2000 permutations
+    intervals = [slice(None, None)]
+    for seed in range(4):
+        series = np.random.default_rng(seed).normal(0.0, 1.0, 80)
+        candidate = PairDistanceCalculator(series).get_next_candidate(intervals)
+        fitted = FittedNullSignificanceTester(max_pvalue=0.01, calculator=PairDistanceCalculator, seed=seed)
+        permuted = PermutationsSignificanceTester(
+            max_pvalue=0.01, permutations=2000, calculator=PairDistanceCalculator, seed=seed
+        )
+        fitted_pvalue = fitted.change_point(candidate, series, intervals).stats.pvalue
+        permuted_pvalue = permuted.change_point(candidate, series, intervals).stats.pvalue
+        assert abs(fitted_pvalue - permuted_pvalue) < 0.1
+
+    # In the tail, around max_pvalue = 0.001, they are within a factor of 3 from p-values of 10000 permutations
+    for seed in [0, 5, 11]:
+        rng = np.random.default_rng(seed)
+        series = rng.normal(0.0, 1.0, 80)
+        series[40:] += 0.6
+        candidate = PairDistanceCalculator(series).get_next_candidate(intervals)
+        fitted = FittedNullSignificanceTester(max_pvalue=0.001, calculator=PairDistanceCalculator, seed=seed)
+        permuted = PermutationsSignificanceTester(
+            max_pvalue=0.001, permutations=10000, calculator=PairDistanceCalculator, seed=seed
+        )
+        fitted_pvalue = fitted.change_point(candidate, series, intervals).stats.pvalue
+        permuted_pvalue = permuted.change_point(candidate, series, intervals).stats.pvalue
+        assert permuted_pvalue / 3 < fitted_pvalue < permuted_pvalue * 3
+
+
+def test_fitted_null_tester_constant_intervals():
+    st = FittedNullSignificanceTester(max_pvalue=0.01, calculator=PairDistanceCalculator, seed=1)
+    # Constant values can't be split
+    series = np.ones(20)
+    intervals = [slice(None, None)]
+    candidate = PairDistanceCalculator(series).get_next_candidate(intervals)
+    assert st.change_point(candidate, series, intervals).stats.pvalue == 1.0
+
+    # Nor can be the constant pieces of a piecewise-constant series
+    series = np.concatenate([np.ones(10), np.full(10, 2.0)])
+    intervals = [slice(0, 10), slice(10, None)]
+    candidate = PairDistanceCalculator(series).get_next_candidate(intervals)
+    assert st.change_point(candidate, series, intervals).stats.pvalue == 1.0
+
+    # A constant interval after the others doesn't change the p-value of the candidate
+    series = np.concatenate([np.random.default_rng(1).normal(0.0, 1.0, 20), np.ones(10)])
+    candidate = PairDistanceCalculator(series).get_candidate_change_point(slice(0, 20))
+    pvalue = st.change_point(candidate, series, [slice(0, 20)]).stats.pvalue
+    assert st.change_point(candidate, series, [slice(0, 20), slice(20, None)]).stats.pvalue == pvalue
+
+    # Intervals shorter than 2 points don't make a candidate significant
+    assert st.change_point(CandidateChangePoint(index=1, qhat=1.0), series, [slice(0, 1)]).stats.pvalue == 1.0
@@ -0,0 +1,153 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from otava.checkpoint import CheckpointStore
+from otava.data_selector import DataSelector
+from otava.series import AnalysisOptions, Metric, Series
+
+
+def _series(length: int, metrics=("m1", "m2")) -> Series:
+    rng = np.random.default_rng(0)
+    data = {}
+    for i, metric in enumerate(metrics):
+        values = rng.normal(10.0 * (i + 1), 0.5, 120)
+        values[40:] += 3.0
+        values[90:] -= 6.0
+        data[metric] = [float(v) for v in values[:length]]
+    return Series(
+        "test",
+        branch=None,
+        time=list(range(1000, 1000 + length)),
+        metrics={metric: Metric(-1, 2.0, "ms") for metric in metrics},
+        data=data,
+        attributes={"commit": [f"c{i}" for i in range(length)]},
+    )
+
+
+def _change_points(analyzed_series):
+    return {
+        metric: [(cp.index, cp.time, cp.stats.pvalue) for cp in cps]
+        for metric, cps in analyzed_series.change_points.items()
+    }
+
+
+def test_save_and_load():
+    selector = DataSelector()
+    options = AnalysisOptions()
+    options.window_len = 30
+    analyzed_series = _series(120).analyze(options)
+    with tempfile.TemporaryDirectory() as directory:
+        store = CheckpointStore(directory)
+        assert store.load("test", selector, options) is None
+        store.save(selector, analyzed_series)
+        loaded = store.load("test", selector, options)
+    assert np.array_equal(loaded.time(), analyzed_series.time())
+    assert np.array_equal(loaded.data("m1"), analyzed_series.data("m1"))
+    assert loaded.attribute_values("commit") == analyzed_series.attribute_values("commit")
+    assert loaded.metric("m2").direction == -1 and loaded.metric("m2").unit == "ms"
+    assert _change_points(loaded) == _change_points(analyzed_series)
+    assert [g.index for g in loaded.change_points_by_time] == [40, 90]
+
+
+def test_append():
+    selector = DataSelector()
+    options = AnalysisOptions()
+    options.window_len = 30
+    with tempfile.TemporaryDirectory() as directory:
+        store = CheckpointStore(directory)
+        store.save(selector, _series(100).analyze(options))
+        loaded = store.load("test", selector, options)
+        # The importer fetches the whole selection again, points up to the checkpoint are skipped
+        assert store.append(loaded, _series(120))
+        assert store.append(loaded, _series(120))
+
+    expected = _series(100).analyze(options)
+    new_points = _series(120)
+    expected.append(
+        time=new_points.time[100:].tolist(),
+        new_data={metric: values[100:] for metric, values in new_points.data.items()},
+        attributes={"commit": new_points.attributes["commit"][100:]},
+    )
+    assert np.array_equal(loaded.time(), new_points.time)
+    assert loaded.attribute_values("commit") == new_points.attributes["commit"]
+    assert _change_points(loaded) == _change_points(expected)
+
+
+def test_append_different_metrics():
+    selector = DataSelector()
+    options = AnalysisOptions()
+    with tempfile.TemporaryDirectory() as directory:
+        store = CheckpointStore(directory)
+        store.save(selector, _series(100).analyze(options))
+        loaded = store.load("test", selector, options)
+        assert not store.append(loaded, _series(120, metrics=("m1",)))
+        assert loaded.time().tolist() == list(range(1000, 1100))
+
+
+def test_append_different_selection():
+    selector = DataSelector()
+    options = AnalysisOptions()
+    options.window_len = 30
+    with tempfile.TemporaryDirectory() as directory:
+        store = CheckpointStore(directory)
+        store.save(selector, _series(100).analyze(options))
+        loaded = store.load("test", selector, options)
+        # The selection starts later, e.g., with --last or when old points fall out of the selected time range
+        assert not store.append(loaded, _series(120).between(since=datetime.fromtimestamp(1015, tz=timezone.utc)))
+        # The selection ends before the last analyzed point
+        assert not store.append(loaded, _series(90))
+        # A data point of the checkpoint has a different value now
+        series = _series(120)
+        series.data["m1"][10] += 1.0
+        assert not store.append(loaded, series)
+        assert loaded.time().tolist() == list(range(1000, 1100))
+
+
+def test_checkpoint_key():
+    selector = DataSelector()
+    options = AnalysisOptions()
+    store = CheckpointStore("checkpoints")
+    path = store.path("test", selector, options)
+
+    other_options = AnalysisOptions()
+    other_options.max_pvalue = 0.01
+    assert store.path("test", selector, other_options) != path
+    other_options = AnalysisOptions()
+    other_options.split_workers = 4
+    assert store.path("test", selector, other_options) == path
+    other_selector = DataSelector()
+    other_selector.branch = "main"
+    assert store.path("test", other_selector, options) != path
+    assert store.path("other", selector, options) != path
+
+
+def test_unusable_checkpoint():
+    selector = DataSelector()
+    options = AnalysisOptions()
+    with tempfile.TemporaryDirectory() as directory:
+        store = CheckpointStore(directory)
+        store.path("test", selector, options).write_text("{not json")
+        assert store.load("test", selector, options) is None
+
+        options.orig_edivisive = True
+        store.save(selector, _series(100).analyze(options))
+        assert not store.path("test", selector, options).exists()
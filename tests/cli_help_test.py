@@ -162,7 +162,12 @@ usage: otava analyze [-h] [--config-file CONFIG_FILE] [--graphite-url GRAPHITE_U
                      [--output {{log,json,regressions_only}}] [--branch [STRING]] [--metrics LIST]
 {usage_filter_lines}
                      [--last COUNT] [-P, --p-value PVALUE] [-M MAGNITUDE] [--window WINDOW]
-                     [--orig-edivisive ORIG_EDIVISIVE]
+                     [--orig-edivisive ORIG_EDIVISIVE] [--multivariate]
+                     [--calculator {{pair_distance,blocked}}] [--permutation-workers COUNT]
+                     [--fitted-null] [--fixed-stride-split] [--split-workers COUNT] [--jobs COUNT]
+                     [--jobs-backend {{process,thread}}] [--checkpoint-dir DIR]
+                     [--fetch-workers COUNT] [--analysis-workers COUNT] [--cache-dir DIR]
+                     [--cache-size MB]
                      tests [tests ...]
 
 positional arguments:
@@ -218,6 +223,42 @@ options:
   --orig-edivisive ORIG_EDIVISIVE
                         use the original edivisive algorithm with no windowing and weak change
                         points analysis improvements
+  --multivariate        analyze all metrics of a test jointly with the original edivisive
+                        algorithm, reporting one change point for a change that affects several
+                        metrics at once
+  --calculator {pair_distance,blocked}
+                        the method used to find candidate change points; 'blocked' finds the same
+                        candidates as 'pair_distance' without keeping a quadratic matrix of
+                        distances in memory
+  --permutation-workers COUNT
+                        the number of processes running the permutation tests of --orig-edivisive
+                        and --multivariate in parallel
+  --fitted-null         approximate P-values of --orig-edivisive and --multivariate by a
+                        distribution fitted to permutations of intervals of a similar length
+                        instead of running permutation tests for every candidate; resolves
+                        P-values below the reach of the permutation tests, but less exactly
+  --fixed-stride-split  start the windows of the split step at fixed offsets, so they can be
+                        analyzed in parallel; finds almost the same change points as the default
+                        mode
+  --split-workers COUNT
+                        the number of processes analyzing the windows of --fixed-stride-split in
+                        parallel; requires --fixed-stride-split
+  --jobs COUNT          the number of metrics of a test analyzed in parallel
+  --jobs-backend {process,thread}
+                        run the parallel --jobs in processes (default) or threads
+  --checkpoint-dir DIR  keep the analyzed series of each test in DIR and only analyze the data
+                        points added since the previous run; applies to the default windowed
+                        algorithm
+  --fetch-workers COUNT
+                        the number of tests whose data are fetched concurrently
+  --analysis-workers COUNT
+                        the number of processes analyzing the fetched tests in parallel; with 1,
+                        the tests are analyzed in the current process
+  --cache-dir DIR       keep the change points found in DIR and reuse them when the same data are
+                        analyzed with the same options again; the directory can be shared by
+                        concurrent runs
+  --cache-size MB       the maximum size of --cache-dir in MB; the least recently used results are
+                        evicted first
 
 Graphite Options:
   Options for Graphite configuration
@@ -24,7 +24,7 @@ from otava.config import (
     NestedYAMLConfigFileParser,
     load_config_from_file,
 )
-from otava.main import create_otava_cli_parser
+from otava.main import OtavaError, analysis_options_from_args, create_otava_cli_parser
 from otava.test_config import CsvTestConfig, GraphiteTestConfig, HistoStatTestConfig
 
 
@@ -310,3 +310,14 @@ def test_unknown_argument_raises_error(capsys):
     # Check error message
     captured = capsys.readouterr()
     assert "unrecognized arguments: --banana" in captured.err
+
+
+def test_split_workers_require_fixed_stride_split():
+    parser = create_otava_cli_parser()
+    args = parser.parse_args(["analyze", "--split-workers", "4", "test"])
+    with pytest.raises(OtavaError):
+        analysis_options_from_args(args)
+
+    args = parser.parse_args(["analyze", "--fixed-stride-split", "--split-workers", "4", "test"])
+    options = analysis_options_from_args(args)
+    assert options.fixed_stride_split and options.split_workers == 4
@@ -16,6 +16,7 @@
 # under the License.
 
 import csv
+import json
 import os
 import subprocess
 import tempfile
@@ -307,3 +308,81 @@ def test_analyze_csv_with_branch_filter():
         assert "aaa" not in output
         # Should show a change point (increase ~50%)
         assert "+" in output and "%" in output
+
+
+def test_analyze_csv_group():
+    """
+    E2E test: tests of a group are analyzed concurrently, but their reports are printed
+    in the order of the group, and a test failing to import doesn't affect the others.
+    """
+    now = datetime.now()
+    shifts = {"first": 0.5, "second": 1.0, "third": 2.0}
+    config_content = textwrap.dedent(
+        """\
+        tests:
+          first:
+            type: csv
+            file: data/first.csv
+            time_column: time
+            metrics: [metric1]
+          missing:
+            type: csv
+            file: data/missing.csv
+            time_column: time
+            metrics: [metric1]
+          second:
+            type: csv
+            file: data/second.csv
+            time_column: time
+            metrics: [metric1]
+          third:
+            type: csv
+            file: data/third.csv
+            time_column: time
+            metrics: [metric1]
+        test_groups:
+          all: [first, missing, second, third]
+        """
+    )
+
+    with tempfile.TemporaryDirectory() as td:
+        td_path = Path(td)
+        data_dir = td_path / "data"
+        data_dir.mkdir(parents=True, exist_ok=True)
+        for name, shift in shifts.items():
+            with open(data_dir / f"{name}.csv", "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["time", "metric1"])
+                for i in range(20):
+                    ts = now - timedelta(days=20 - i)
+                    value = 10.0 + (i % 3) * 0.01 + (shift if i >= 10 else 0.0)
+                    writer.writerow([ts.strftime("%Y.%m.%d %H:%M:%S %z"), value])
+
+        config_path = td_path / "otava.yaml"
+        config_path.write_text(config_content, encoding="utf-8")
+
+        outputs = []
+        for workers in (
+            [],
+            ["--analysis-workers", "2"],
+            ["--fetch-workers", "1", "--analysis-workers", "1"],
+            # A single fetching thread doesn't wait for the analyses, so they still run in parallel
+            ["--fetch-workers", "1", "--analysis-workers", "2", "--checkpoint-dir", "checkpoints"],
+        ):
+            cmd = ["uv", "run", "otava", "analyze", "all", "--output", "json"] + workers
+            proc = subprocess.run(
+                cmd,
+                cwd=str(td_path),
+                capture_output=True,
+                text=True,
+                timeout=120,
+                env=dict(os.environ, OTAVA_CONFIG=str(config_path)),
+            )
+            assert proc.returncode == 0, proc.stderr
+            assert "missing.csv" in proc.stderr
+            outputs.append(proc.stdout)
+
+        assert outputs[0] == outputs[1] == outputs[2] == outputs[3]
+        assert len(list((td_path / "checkpoints").iterdir())) == 3
+        reports = [json.loads(line) for line in outputs[0].splitlines() if line.strip()]
+        assert [list(report.keys()) for report in reports] == [["first"], ["second"], ["third"]]
@@ -16,11 +16,13 @@
 # under the License.
 
 import time
+from datetime import datetime, timezone
 from random import random
 
+import numpy as np
 import pytest
 
-from otava.series import AnalysisOptions, Metric, Series
+from otava.series import AnalysisOptions, AttributeColumn, Metric, Series
 
 
 def test_change_point_detection():
@@ -112,6 +114,30 @@ def test_change_point_detection_performance():
     assert (end_time - start_time) < 0.5
 
 
+@pytest.mark.parametrize("calculator", ["blocked"])
+def test_change_point_detection_calculator(calculator):
+    series_1 = [1.02, 0.95, 0.99, 1.00, 1.12, 0.90, 0.50, 0.51, 0.48, 0.48, 0.55]
+    series_2 = [2.02, 2.03, 2.01, 2.04, 1.82, 1.85, 1.79, 1.81, 1.80, 1.76, 1.78]
+    time = list(range(len(series_1)))
+    test = Series(
+        "test",
+        branch=None,
+        time=time,
+        metrics={"series1": Metric(1, 1.0), "series2": Metric(1, 1.0)},
+        data={"series1": series_1, "series2": series_2},
+        attributes={},
+    )
+
+    options = AnalysisOptions()
+    options.calculator = calculator
+    change_points = test.analyze(options).change_points_by_time
+    assert len(change_points) == 2
+    assert change_points[0].index == 4
+    assert change_points[0].changes[0].metric == "series2"
+    assert change_points[1].index == 6
+    assert change_points[1].changes[0].metric == "series1"
+
+
 def test_get_stable_range():
     series_1 = [1.02, 0.95, 0.99, 1.00, 1.12, 0.90, 0.50, 0.51, 0.48, 0.48, 0.55]
     series_2 = [2.02, 2.03, 2.01, 2.04, 1.82, 1.85, 1.79, 1.81, 1.80, 1.76, 1.78]
@@ -151,20 +177,21 @@ def test_incremental_otava():
     )
 
     analyzed_series = test.analyze()
-    analyzed_series.append(time=[len(time)], new_data={"series1": [0.5], "series2": [1.97]}, attributes={})
+    analyzed_series.append(time=[11], new_data={"series1": [0.5], "series2": [1.97]}, attributes={})
     change_points = analyzed_series.change_points
     assert [c.index for c in change_points["series1"]] == [6]
     assert [c.index for c in change_points["series2"]] == [4]
 
-    analyzed_series.append(time=[len(time)], new_data={"series1": [0.51]}, attributes={})
+    # series2 has a missing value at time 12
+    analyzed_series.append(time=[12], new_data={"series1": [0.51]}, attributes={})
     change_points = analyzed_series.change_points
     assert [c.index for c in change_points["series1"]] == [6]
     assert [c.index for c in change_points["series2"]] == [4]
 
-    analyzed_series.append(time=[len(time)], new_data={"series2": [33.33, 46.46]}, attributes={})
+    analyzed_series.append(time=[13, 14], new_data={"series2": [33.33, 46.46]}, attributes={})
     change_points = analyzed_series.change_points
     assert [c.index for c in change_points["series1"]] == [6]
-    assert [c.index for c in change_points["series2"]] == [4, 12]
+    assert [c.index for c in change_points["series2"]] == [4, 13]
 
 
 def test_validate():
@@ -196,7 +223,7 @@ def test_validate():
     analyzed_series = test.analyze()
     analyzed_series.append(time=[len(time)], new_data={"series1": [0.5], "series2": [1.97]}, attributes={})
 
-    err = analyzed_series._validate_append(time=[len(time)], new_data={"series1": [0.51]}, attributes={})
+    err = analyzed_series._validate_append(time=[len(time) + 1], new_data={"series1": [0.51]}, attributes={})
     assert err is None
 
     err = analyzed_series._validate_append(time=[5], new_data={"series1": [0.51]}, attributes={})
@@ -222,7 +249,7 @@ def test_can_append():
     analyzed_series = test.analyze()
     analyzed_series.append(time=[len(time)], new_data={"series1": [0.5], "series2": [1.97]}, attributes={})
 
-    can = analyzed_series.can_append(time=[len(time)], new_data={"series1": [0.51]}, attributes={})
+    can = analyzed_series.can_append(time=[len(time) + 1], new_data={"series1": [0.51]}, attributes={})
     assert can
 
     can = analyzed_series.can_append(time=[5], new_data={"series1": [0.51]}, attributes={})
@@ -251,3 +278,211 @@ def test_orig_edivisive():
     # assert len(change_points) == 2
     # assert change_points[0].index == 4
     # assert change_points[1].index == 6
+
+
+def test_multivariate():
+    series_1 = [1.02, 0.95, 0.99, 1.00, 1.12, 0.90, 0.50, 0.51, 0.48, 0.48, 0.55]
+    series_2 = [2.02, 2.03, 2.01, 2.04, 1.82, 1.85, 1.79, 1.81, 1.80, 1.76, 1.78]
+    time = list(range(len(series_1)))
+    test = Series(
+        "test",
+        branch=None,
+        time=time,
+        metrics={"series1": Metric(1, 1.0), "series2": Metric(1, 1.0)},
+        data={"series1": series_1, "series2": series_2},
+        attributes={},
+    )
+
+    options = AnalysisOptions()
+    options.multivariate = True
+    options.max_pvalue = 0.05
+
+    change_points = test.analyze(options=options).change_points_by_time
+    # Permutation test is random, so only the strongest change point is certain
+    assert 6 in [cp.index for cp in change_points]
+    for cp in change_points:
+        assert [c.metric for c in cp.changes] == ["series1", "series2"]
+
+
+def test_columnar_series():
+    test = Series(
+        "test",
+        branch=None,
+        time=[10, 20, 30, 40],
+        metrics={"m1": Metric(1, 1.0), "m2": Metric(1, 1.0)},
+        data={"m1": [1.0, None, 3.0, 4.0], "m2": [5.0, 6.0, 7.0, None]},
+        attributes={"commit": ["a", "b", "c", "d"]},
+    )
+    assert test.time.dtype == np.int64
+    assert test.values.shape == (2, 4)
+    assert np.isnan(test.data["m1"][1]) and np.isnan(test.data["m2"][3])
+    assert np.shares_memory(test.data["m2"], test.values)
+
+    assert test.find_first_not_earlier_than(datetime.fromtimestamp(20, tz=timezone.utc)) == 1
+    assert test.find_first_not_earlier_than(datetime.fromtimestamp(21, tz=timezone.utc)) == 2
+    assert test.find_first_not_earlier_than(datetime.fromtimestamp(41, tz=timezone.utc)) is None
+    window = test.between(datetime.fromtimestamp(15, tz=timezone.utc), datetime.fromtimestamp(40, tz=timezone.utc))
+    assert window.time.tolist() == [20, 30]
+    assert window.data["m2"].tolist() == [6.0, 7.0]
+    assert window.attributes == {"commit": ["b", "c"]}
+
+    test.extend([50], {"m1": [5.0]}, {})
+    assert test.time.tolist() == [10, 20, 30, 40, 50]
+    assert test.data["m1"][4] == 5.0 and np.isnan(test.data["m2"][4])
+    assert test.attributes["commit"] == ["a", "b", "c", "d", None]
+
+
+def test_fractional_time():
+    # E.g., timestamps with microseconds imported from a database
+    time = [1000.25 + i for i in range(60)]
+    test = Series(
+        "test",
+        branch=None,
+        time=time,
+        metrics={"m1": Metric(1, 1.0)},
+        data={"m1": [1.0] * 30 + [2.0] * 30},
+        attributes={},
+    )
+    assert test.time.dtype == np.float64
+    assert test.time.tolist() == time
+    change_points = test.analyze().change_points_by_time
+    assert [(cp.index, cp.time, cp.prev_time) for cp in change_points] == [(30, 1030.25, 1029.25)]
+    assert change_points[0].changes[0].time == 1030.25
+
+    # Integral times are kept in an int64 array, whatever their type
+    test = Series("test", branch=None, time=[10.0, 20.0], metrics={}, data={}, attributes={})
+    assert test.time.dtype == np.int64
+    test.extend([30.5], {}, {})
+    assert test.time.tolist() == [10.0, 20.0, 30.5]
+
+
+def test_unsorted_time():
+    test = Series(
+        "test",
+        branch=None,
+        time=[40, 30, 20, 10],
+        metrics={"m1": Metric(1, 1.0)},
+        data={"m1": [1.0, 2.0, 3.0, 4.0]},
+        attributes={},
+    )
+    assert test.find_first_not_earlier_than(datetime.fromtimestamp(25, tz=timezone.utc)) == 0
+    assert test.find_first_not_earlier_than(datetime.fromtimestamp(41, tz=timezone.utc)) is None
+    window = test.between(since=datetime.fromtimestamp(15, tz=timezone.utc))
+    assert window.data["m1"].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_attribute_column():
+    column = AttributeColumn(["v1", "v2", "v1", None, "v3", "v1"])
+    assert column.categories == ["v1", "v2", None, "v3"]
+    assert column.codes.tolist() == [0, 1, 0, 2, 3, 0]
+    assert column == ["v1", "v2", "v1", None, "v3", "v1"]
+    assert column[1] == "v2" and column[-1] == "v1"
+    assert column[2:4] == ["v1", None]
+    assert column.positions("v1").tolist() == [0, 2, 5]
+    assert column.positions(None).tolist() == [3]
+    assert column.positions("v4").tolist() == []
+
+    column.extend(AttributeColumn(["v4", "v1"]))
+    column.extend(["v2"])
+    assert column.categories == ["v1", "v2", None, "v3", "v4"]
+    assert column.positions("v1").tolist() == [0, 2, 5, 7]
+    assert column.positions("v2").tolist() == [1, 8]
+    assert len(column) == 9
+
+
+def test_find_by_attribute():
+    test = Series(
+        "test",
+        branch=None,
+        time=[1, 2, 3, 4, 5],
+        metrics={"m1": Metric(1, 1.0)},
+        data={"m1": [1.0, 2.0, 3.0, 4.0, 5.0]},
+        attributes={"commit": ["a", "b", "c", "d", "e"], "version": ["1", "1", "2", "2", "2"]},
+    )
+    assert test.find_by_attribute("commit", "c") == [2]
+    assert test.find_by_attribute("version", "2") == [2, 3, 4]
+    assert test.find_by_attribute("version", "3") == []
+    assert test.find_by_attribute("branch", "main") == []
+    assert test.attributes_at(3) == {"commit": "d", "version": "2"}
+
+    analyzed = test.analyze()
+    assert analyzed.to_json()["attributes"] == {"commit": ["a", "b", "c", "d", "e"], "version": ["1", "1", "2", "2", "2"]}
+
+
+@pytest.mark.parametrize("jobs_backend", ["process", "thread"])
+@pytest.mark.parametrize("calculator", ["pair_distance", "blocked"])
+def test_parallel_jobs(jobs_backend, calculator):
+    rng = np.random.default_rng(1)
+    data = {}
+    for i in range(5):
+        values = rng.normal(10.0, 0.5, 100)
+        values[30 + 10 * i:] += 3.0
+        data[f"m{i}"] = values.tolist()
+
+    def series():
+        return Series(
+            "test",
+            branch=None,
+            time=list(range(100)),
+            metrics={metric: Metric(1, 1.0) for metric in data},
+            data=data,
+            attributes={},
+        )
+
+    options = AnalysisOptions()
+    options.calculator = calculator
+    serial = series().analyze(options)
+    options.jobs = 2
+    options.jobs_backend = jobs_backend
+    parallel = series().analyze(options)
+    assert parallel.change_points == serial.change_points
+
+    new_data = {metric: rng.normal(20.0, 0.5, 20).tolist() for metric in data}
+    serial.append(time=list(range(100, 120)), new_data=new_data, attributes={})
+    parallel.append(time=list(range(100, 120)), new_data=new_data, attributes={})
+    assert parallel.change_points == serial.change_points
+    assert parallel.weak_change_points == serial.weak_change_points
+
+
+def test_lazy_change_points():
+    rng = np.random.default_rng(2)
+    data = {}
+    for i in range(4):
+        values = rng.normal(10.0, 0.5, 100)
+        values[40 + 10 * i:] += 3.0
+        data[f"m{i}"] = values.tolist()
+
+    def series():
+        return Series(
+            "test",
+            branch=None,
+            time=list(range(100)),
+            metrics={metric: Metric(1, 1.0) for metric in data},
+            data=data,
+            attributes={},
+        )
+
+    analyzed = series().analyze()
+    assert analyzed.change_points.pending() == ["m0", "m1", "m2", "m3"]
+    assert [c.index for c in analyzed.change_points["m2"]] == [60]
+    assert analyzed.change_points.pending() == ["m0", "m1", "m3"]
+    assert [g.index for g in analyzed.change_points_by_time] == [40, 50, 60, 70]
+    assert analyzed.change_points.pending() == []
+
+    subset = series().analyze()
+    assert [g.index for g in subset.change_points_by_time_of(["m1", "m3"])] == [50, 70]
+    assert subset.change_points.pending() == ["m0", "m2"]
+
+    eager = series().analyze()
+    eager.compute()
+    assert analyzed.change_points == eager.change_points
+    assert analyzed.weak_change_points == eager.weak_change_points
+
+    # Appending to a partially computed series gives the same result as to a fully computed one
+    partially_computed = series().analyze()
+    assert len(partially_computed.change_points["m1"]) == 1
+    new_data = {metric: rng.normal(20.0, 0.5, 20).tolist() for metric in data}
+    partially_computed.append(time=list(range(100, 120)), new_data=new_data, attributes={})
+    eager.append(time=list(range(100, 120)), new_data=new_data, attributes={})
+    assert partially_computed.change_points == eager.change_points
+    assert [g.index for g in partially_computed.change_points_by_time] == [g.index for g in eager.change_points_by_time]
@@ -0,0 +1,127 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from otava.series import AnalysisOptions, AnalyzedSeries, Metric, Series
+from otava.snapshot import SnapshotError, read_snapshot, write_snapshot
+
+
+def _analyzed_series() -> AnalyzedSeries:
+    rng = np.random.default_rng(0)
+    m1 = rng.normal(10.0, 0.5, 200)
+    m1[80:] += 3.0
+    m2 = rng.normal(100.0, 2.0, 200)
+    m2[150:] -= 20.0
+    m2 = [None if i % 17 == 0 else float(v) for i, v in enumerate(m2)]
+    series = Series(
+        "test",
+        branch="main",
+        time=list(range(1000, 1200)),
+        metrics={"m1": Metric(1, 1.0, "ms"), "m2": Metric(-1, 2.0, "ops")},
+        data={"m1": m1.tolist(), "m2": m2},
+        attributes={
+            "commit": [f"c{i}" for i in range(200)],
+            "version": [None if i < 10 else f"v{i // 50}" for i in range(200)],
+        },
+    )
+    options = AnalysisOptions()
+    options.window_len = 30
+    return series.analyze(options)
+
+
+@pytest.mark.parametrize("memory_map", [True, False])
+def test_round_trip(memory_map):
+    analyzed_series = _analyzed_series()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.snapshot")
+        with open(path, "wb") as file:
+            write_snapshot(analyzed_series, file)
+        loaded = read_snapshot(path, memory_map=memory_map)
+
+    assert loaded.to_json() == analyzed_series.to_json()
+    assert loaded.change_points == analyzed_series.change_points
+    assert loaded.weak_change_points == analyzed_series.weak_change_points
+    assert [g.index for g in loaded.change_points_by_time] == [80, 150]
+    assert loaded.options.window_len == 30
+    assert not loaded.time().flags.writeable
+
+    # The loaded series can be extended, the arrays are copied on append
+    loaded.append(time=[1200, 1201], new_data={"m1": [13.0, 13.1]}, attributes={"commit": ["c200", "c201"]})
+    assert loaded.len() == 202
+    assert loaded.attribute_values("version")[-1] is None
+
+
+def test_fractional_time():
+    series = Series(
+        "test",
+        branch=None,
+        time=[1000.5 + i for i in range(60)],
+        metrics={"m1": Metric(1, 1.0, "ms")},
+        data={"m1": [1.0] * 30 + [2.0] * 30},
+        attributes={},
+    )
+    analyzed_series = series.analyze()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.snapshot")
+        with open(path, "wb") as file:
+            write_snapshot(analyzed_series, file)
+        loaded = read_snapshot(path)
+    assert loaded.time().tolist() == series.time.tolist()
+    assert loaded.change_points["m1"][0].time == 1030.5
+
+
+def test_smaller_than_json():
+    analyzed_series = _analyzed_series()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.snapshot")
+        with open(path, "wb") as file:
+            write_snapshot(analyzed_series, file)
+        assert os.path.getsize(path) < len(json.dumps(analyzed_series.to_json()))
+
+
+def test_empty_series():
+    series = Series("test", branch=None, time=[], metrics={}, data={}, attributes={})
+    analyzed_series = series.analyze()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.snapshot")
+        with open(path, "wb") as file:
+            write_snapshot(analyzed_series, file)
+        loaded = read_snapshot(path)
+    assert loaded.to_json() == analyzed_series.to_json()
+
+
+def test_invalid_snapshot():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.snapshot")
+        for content in [b"", b"{not a snapshot}", b"OTAVASNP\x10\x00\x00\x00\x00\x00\x00\x00{}"]:
+            with open(path, "wb") as file:
+                file.write(content)
+            with pytest.raises(SnapshotError):
+                read_snapshot(path)
+
+        with open(path, "wb") as file:
+            write_snapshot(_analyzed_series(), file)
+        with open(path, "r+b") as file:
+            file.truncate(os.path.getsize(path) // 2)
+        with pytest.raises(SnapshotError):
+            read_snapshot(path)